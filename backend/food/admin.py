@@ -1,9 +1,21 @@
+from collections import defaultdict
+
 from django.contrib import admin
+from django.db import transaction
 from django.db.models import Count
 from django.utils.safestring import mark_safe
 from .models import (User, Ingredient, Recipe, IngredientRecipe,
-                     Favorite, ShoppingCart)
+                     Favorite, ShoppingCart, ShoppingListItem,
+                     MediaFile)
 from users.models import Subscription
+from .services import (
+    add_recipe_to_shopping_lists,
+    get_ingredients_diff,
+    get_recipe_ingredients,
+    remove_recipe_from_shopping_lists,
+    remove_recipes_from_shopping_list,
+    send_recipe_ingredients_changed,
+)
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
 
@@ -33,22 +45,34 @@ class BooleanRelationFilter(admin.SimpleListFilter):
         return queryset
 
 
-class HasRecipesFilter(BooleanRelationFilter):
+class BooleanCounterFilter(BooleanRelationFilter):
+    counter_name = ""
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value == self.YES:
+            return queryset.filter(**{f"{self.counter_name}__gt": 0})
+        if value == self.NO:
+            return queryset.filter(**{self.counter_name: 0})
+        return queryset
+
+
+class HasRecipesFilter(BooleanCounterFilter):
     title = "наличие рецептов"
     parameter_name = "has_recipes"
-    relation_name = "recipes"
+    counter_name = "recipes_count"
 
 
-class HasSubscriptionsFilter(BooleanRelationFilter):
+class HasSubscriptionsFilter(BooleanCounterFilter):
     title = "наличие подписок"
     parameter_name = "has_subscriptions"
-    relation_name = "subscribers"
+    counter_name = "subscriptions_count"
 
 
-class HasSubscribersFilter(BooleanRelationFilter):
+class HasSubscribersFilter(BooleanCounterFilter):
     title = "наличие подписчиков"
     parameter_name = "has_subscribers"
-    relation_name = "followers"
+    counter_name = "subscribers_count"
 
 
 class HasIngredientRecipesFilter(BooleanRelationFilter):
@@ -97,17 +121,6 @@ class UserAdmin(BaseUserAdmin):
         ("Permissions", {"fields": ("is_active", "is_staff", "is_superuser")}),
     )
 
-    def get_queryset(self, request):
-        return (
-            super()
-            .get_queryset(request)
-            .annotate(
-                recipes_count=Count("recipes", distinct=True),
-                subscriptions_count=Count("subscribers", distinct=True),
-                followers_count=Count("subscribers", distinct=True),
-            )
-        )
-
     @admin.display(description="ФИО")
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}"
@@ -118,18 +131,6 @@ class UserAdmin(BaseUserAdmin):
             return mark_safe(f'<img src="{obj.avatar.url}" width="50" height="50" />')
         return "Нет аватара"
 
-    @admin.display(description="Рецепты", ordering="recipes_count")
-    def recipes_count(self, obj):
-        return obj.recipes_count
-
-    @admin.display(description="Подписки", ordering="subscriptions_count")
-    def subscriptions_count(self, obj):
-        return obj.subscriptions_count
-
-    @admin.display(description="Подписчики", ordering="followers_count")
-    def subscribers_count(self, obj):
-        return obj.followers_count
-
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
@@ -195,6 +196,7 @@ class RecipeAdmin(admin.ModelAdmin):
         "cooking_time",
         "author",
         "favorites_count",
+        "shopping_carts_count",
         "ingredients_list",
         "get_image_preview",
     )
@@ -202,13 +204,14 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = (CookingTimeFilter, "author")
     inlines = (IngredientRecipeInline,)
 
-    def get_queryset(self, request):
-        return (
-            super()
-            .get_queryset(request)
-            .annotate(
-                _favorites_count=Count("favorite_relations"),
-            )
+    @transaction.atomic
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        old = get_recipe_ingredients(recipe)
+        super().save_related(request, form, formsets, change)
+        send_recipe_ingredients_changed(
+            recipe,
+            *get_ingredients_diff(old, get_recipe_ingredients(recipe)),
         )
 
     @admin.display(description="Ингредиенты")
@@ -224,10 +227,6 @@ class RecipeAdmin(admin.ModelAdmin):
             return mark_safe(f'<img src="{recipe.image.url}" width="50" height="50" />')
         return "Нет изображения"
 
-    @admin.display(description="В избранном", ordering="_favorites_count")
-    def favorites_count(self, recipe):
-        return recipe._favorites_count
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -260,9 +259,41 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "recipe__name")
     list_filter = ("user", "recipe")
 
-
-@admin.register(IngredientRecipe)
-class IngredientRecipeAdmin(admin.ModelAdmin):
-    list_display = ("recipe", "ingredient", "amount")
-    search_fields = ("recipe__name", "ingredient__name")
-    list_filter = ("recipe", "ingredient")
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.select_related("user", "recipe").get(
+                pk=obj.pk
+            )
+            remove_recipe_from_shopping_lists(old.recipe, old.user)
+        super().save_model(request, obj, form, change)
+        add_recipe_to_shopping_lists(obj.recipe, obj.user)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        remove_recipe_from_shopping_lists(obj.recipe, obj.user)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        recipes_by_user = defaultdict(list)
+        for user_id, recipe_id in queryset.values_list("user", "recipe"):
+            recipes_by_user[user_id].append(recipe_id)
+        users = User.objects.in_bulk(list(recipes_by_user))
+        for user_id, recipe_ids in recipes_by_user.items():
+            remove_recipes_from_shopping_list(users[user_id], recipe_ids)
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ("user", "ingredient", "total_amount", "recipe_count")
+    search_fields = ("user__username", "ingredient__name")
+    list_select_related = ("user", "ingredient")
+
+
+@admin.register(MediaFile)
+class MediaFileAdmin(admin.ModelAdmin):
+    list_display = ("name", "reference_count", "updated_at")
+    search_fields = ("name",)
+    readonly_fields = ("name", "reference_count", "updated_at")
@@ -0,0 +1,93 @@
+from .cache import INGREDIENTS_TAG, get_version, invalidate_tags
+from .models import Ingredient
+
+INDEX_VERSION = INGREDIENTS_TAG
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+class _Node:
+    __slots__ = ('children', 'matches')
+
+    def __init__(self):
+        self.children = {}
+        self.matches = []
+
+
+class IngredientTrie:
+    """
+    Префиксное дерево по названиям ингредиентов.
+
+    Каждый узел хранит первые MAX_LIMIT ингредиентов (в порядке названий),
+    название которых начинается с соответствующего префикса, поэтому поиск
+    по префиксу стоит O(длина префикса). Совпадения по подстроке
+    добираются линейным проходом по названиям в памяти.
+    """
+
+    def __init__(self, ingredients):
+        self.root = _Node()
+        self.ingredients = []
+        self.names = []
+        for ingredient in ingredients:
+            self.add(ingredient)
+
+    def add(self, ingredient):
+        index = len(self.ingredients)
+        name = ingredient.name.lower()
+        self.ingredients.append(ingredient)
+        self.names.append(name)
+
+        node = self.root
+        self._remember(node, index)
+        for char in name:
+            node = node.children.setdefault(char, _Node())
+            self._remember(node, index)
+
+    @staticmethod
+    def _remember(node, index):
+        if len(node.matches) < MAX_LIMIT:
+            node.matches.append(index)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        query = query.lower()
+        node = self.root
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                break
+        prefix_matches = node.matches[:limit] if node else []
+
+        matches = list(prefix_matches)
+        if len(matches) < limit:
+            for index, name in enumerate(self.names):
+                if query in name and not name.startswith(query):
+                    matches.append(index)
+                    if len(matches) == limit:
+                        break
+        return [self.ingredients[index] for index in matches]
+
+
+_index = None
+_index_version = None
+
+
+def get_ingredient_index():
+    global _index, _index_version
+
+    version = get_version(INDEX_VERSION)
+    if _index is None or _index_version != version:
+        _index = IngredientTrie(Ingredient.objects.order_by('name', 'id'))
+        _index_version = version
+    return _index
+
+
+def invalidate_ingredient_index():
+    """
+    Версия меняется только после фиксации транзакции: иначе другой воркер
+    может построить индекс по старым данным и сохранить его под новой
+    версией.
+    """
+    global _index
+
+    _index = None
+    invalidate_tags(INDEX_VERSION)
@@ -0,0 +1,155 @@
+from collections import Counter
+
+from django.db import connection
+from django.utils import timezone
+
+from .cache import (
+    RECIPES_LIST_TAG,
+    RECIPES_SEARCH_TAG,
+    RECIPES_TAG,
+    author_recipes_tag,
+    bump_versions,
+    invalidate_tags,
+    recipe_tag,
+)
+from .images import schedule_renditions
+from .models import IngredientRecipe, Recipe
+from .pagination import RECIPES_COUNT_VERSION
+from .services import (
+    change_counters,
+    change_media_references,
+    get_counter_field,
+    invalidate_user_relations,
+    update_recipe_search_vectors,
+)
+
+MAX_BULK_RECIPE_IDS = 100
+MAX_BULK_IMPORT_SIZE = 50
+
+INSERT_RELATIONS_SQL = """
+    INSERT INTO {table} (user_id, recipe_id, created_at)
+    SELECT %s, recipe.id, %s
+    FROM {recipes} recipe
+    WHERE recipe.id = ANY(%s)
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING recipe_id
+"""
+
+ADDED = 'added'
+REMOVED = 'removed'
+ALREADY_ADDED = 'already_added'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+
+
+def insert_relations(model, user, recipe_ids):
+    """
+    Вставляет связи одним INSERT ... ON CONFLICT DO NOTHING и возвращает
+    id рецептов, связи с которыми действительно добавлены. Уже
+    существующие связи и несуществующие рецепты пропускаются.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            INSERT_RELATIONS_SQL.format(
+                table=model._meta.db_table,
+                recipes=Recipe._meta.db_table,
+            ),
+            [user.pk, timezone.now(), list(recipe_ids)],
+        )
+        return {recipe_id for recipe_id, in cursor.fetchall()}
+
+
+def bulk_add_relations(model, user, recipe_ids, on_add=None):
+    """
+    Добавляет рецепты в избранное или корзину одним INSERT и возвращает
+    {recipe_id: статус}. Счётчики, агрегаты и кеши обновляются только
+    для вставленных строк: связь, добавленная параллельным запросом,
+    не учитывается дважды.
+    """
+    found = set(
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .values_list('pk', flat=True)
+    )
+    added = insert_relations(model, user, found) if found else set()
+
+    if added:
+        change_counters(Recipe, get_counter_field(model, Recipe),
+                        dict.fromkeys(added, 1))
+        if on_add:
+            on_add(user, added)
+        invalidate_user_relations(user.pk)
+
+    return {
+        pk: (
+            NOT_FOUND if pk not in found
+            else ADDED if pk in added
+            else ALREADY_ADDED
+        )
+        for pk in recipe_ids
+    }
+
+
+def bulk_remove_relations(model, user, recipe_ids, on_remove=None):
+    """Удаляет рецепты из избранного или корзины одним DELETE."""
+    found = set(
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .values_list('pk', flat=True)
+    )
+    existing = set(
+        model.objects.filter(user=user, recipe_id__in=found)
+        .values_list('recipe_id', flat=True)
+    )
+
+    if existing:
+        if on_remove:
+            on_remove(user, existing)
+        model.objects.filter(user=user, recipe_id__in=existing).delete()
+
+    return {
+        pk: (
+            NOT_FOUND if pk not in found
+            else REMOVED if pk in existing
+            else NOT_ADDED
+        )
+        for pk in recipe_ids
+    }
+
+
+def bulk_create_recipes(author, items):
+    """
+    Создаёт рецепты из провалидированных данных сериализатора двумя
+    INSERT: для рецептов и для их ингредиентов. Действия обработчиков
+    post_save и recipe_ingredients_changed выполняются пакетно.
+    """
+    if not items:
+        return []
+    recipes = [
+        Recipe(
+            author=author,
+            **{key: value for key, value in data.items()
+               if key != 'ingredients'},
+        )
+        for data in items
+    ]
+    Recipe.objects.bulk_create(recipes)
+    IngredientRecipe.objects.bulk_create([
+        IngredientRecipe(
+            recipe=recipe,
+            ingredient_id=ingredient['id'],
+            amount=ingredient['amount'],
+        )
+        for recipe, data in zip(recipes, items)
+        for ingredient in data['ingredients']
+    ])
+
+    change_counters(type(author), get_counter_field(Recipe, type(author)),
+                    {author.pk: len(recipes)})
+    update_recipe_search_vectors([recipe.pk for recipe in recipes])
+    change_media_references(Counter(recipe.image.name for recipe in recipes))
+    for recipe in recipes:
+        schedule_renditions(recipe, 'image', 'image_renditions',
+                            [recipe_tag(recipe.pk), RECIPES_TAG])
+    bump_versions(RECIPES_COUNT_VERSION)
+    invalidate_tags(RECIPES_TAG, RECIPES_LIST_TAG, RECIPES_SEARCH_TAG,
+                    author_recipes_tag(author.pk))
+    return recipes
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import time
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY_PREFIX = 'version:'
+GENERATION_KEY = 'versions:generation'
+
+
+def get_generation():
+    """
+    Номер последнего сброса версий. Версия начинается с номера сброса,
+    в котором она выдана, поэтому по ней видно, менялся ли тег после
+    получения номера.
+
+    После вытеснения счётчик продолжается с текущего времени в
+    микросекундах, чтобы новые номера были больше уже выданных.
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _next_generation():
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+        return cache.incr(GENERATION_KEY)
+
+
+def _make_version(generation):
+    return f'{generation}:{uuid4().hex}'
+
+
+def _get_version_generation(version):
+    generation, _, _ = version.partition(':')
+    return int(generation) if generation.isdigit() else 0
+
+
+def get_versions(*names):
+    """
+    Возвращает текущие версии именованных наборов данных.
+
+    Версия содержит случайную часть, а не только счётчик, поэтому после
+    вытеснения или очистки кеша она не совпадёт ни с одной из ранее
+    выданных.
+    """
+    keys = {f'{VERSION_KEY_PREFIX}{name}': name for name in names}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        generation = get_generation()
+        for key in missing:
+            cache.add(key, _make_version(generation), timeout=None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def get_version(name):
+    return get_versions(name)[name]
+
+
+def bump_versions(*names):
+    generation = _next_generation()
+    cache.set_many(
+        {
+            f'{VERSION_KEY_PREFIX}{name}': _make_version(generation)
+            for name in names
+        },
+        timeout=None,
+    )
+
+
+RECIPES_TAG = 'recipes'
+USERS_TAG = 'users'
+INGREDIENTS_TAG = 'ingredients'
+RECIPES_LIST_TAG = 'recipes:list'
+RECIPES_SEARCH_TAG = 'recipes:search'
+RANKING_TAG = 'recipes:ranking'
+RESPONSE_KEY_PREFIX = 'response:'
+FRAGMENT_KEY_PREFIX = 'fragment:'
+
+
+def recipe_tag(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def user_tag(user_id):
+    return f'user:{user_id}'
+
+
+def user_relations_tag(user_id):
+    return f'user:{user_id}:relations'
+
+
+def author_recipes_tag(user_id):
+    return f'user:{user_id}:recipes'
+
+
+def invalidate_tags(*tags):
+    """Сбрасывает теги после фиксации текущей транзакции."""
+    transaction.on_commit(lambda: bump_versions(*tags))
+
+
+def get_response_cache_key(request):
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    signature = hashlib.md5(url.encode()).hexdigest()
+    return f'{RESPONSE_KEY_PREFIX}{signature}'
+
+
+def get_many_cached_data(keys):
+    """
+    Возвращает {ключ: данные} для записей, все теги которых актуальны.
+    Версии тегов всех записей читаются одним запросом к кешу.
+    """
+    entries = cache.get_many(keys)
+    tags = {tag for entry in entries.values() for tag in entry['tags']}
+    versions = get_versions(*tags) if tags else {}
+    return {
+        key: entry['data']
+        for key, entry in entries.items()
+        if all(versions.get(tag) == version
+               for tag, version in entry['tags'].items())
+    }
+
+
+def set_many_cached_data(entries, timeout, since=None):
+    """
+    Сохраняет записи вида {ключ: (данные, теги)}.
+
+    since — номер get_generation(), полученный до чтения данных из базы.
+    Записи, теги которых сброшены после него, не сохраняются: данные
+    могли быть прочитаны до изменения, а версия — уже после.
+    """
+    tags = {tag for _, entry_tags in entries.values() for tag in entry_tags}
+    versions = get_versions(*tags) if tags else {}
+    cache.set_many(
+        {
+            key: {
+                'data': data,
+                'tags': {tag: versions[tag] for tag in entry_tags},
+            }
+            for key, (data, entry_tags) in entries.items()
+            if since is None or all(
+                _get_version_generation(versions[tag]) <= since
+                for tag in entry_tags
+            )
+        },
+        timeout,
+    )
+
+
+def get_cached_data(key):
+    return get_many_cached_data([key]).get(key)
+
+
+def set_cached_data(key, data, tags, timeout, since=None):
+    set_many_cached_data({key: (data, tags)}, timeout, since)
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Кеширует сериализованные ответы list/retrieve для анонимных
+    пользователей. Запись помечается тегами из get_response_cache_tags()
+    и считается устаревшей, как только версия любого из тегов меняется.
+    """
+
+    response_cache_timeout = 300
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.cache_generation = get_generation()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['cache_generation'] = getattr(self, 'cache_generation', None)
+        return context
+
+    def get_response_cache_tags(self, data):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request,
+                                        *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request,
+                                        *args, **kwargs)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+
+        key = get_response_cache_key(request)
+        data = get_cached_data(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_cached_data(key, response.data,
+                            self.get_response_cache_tags(response.data),
+                            self.response_cache_timeout,
+                            self.cache_generation)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Отдаёт ETag, вычисленный по версиям тегов из get_etag_tags(), и
+    отвечает 304 на If-None-Match, не выполняя запрос к базе и
+    сериализацию. Last-Modified не отдаётся: ответ зависит и от данных,
+    которые не меняют updated_at (автор, ингредиенты, флаги
+    пользователя), а версии тегов учитывают их все.
+    """
+
+    def get_etag_tags(self):
+        raise NotImplementedError
+
+    def get_etag(self, request):
+        tags = list(self.get_etag_tags())
+        if request.user.is_authenticated:
+            tags.append(user_relations_tag(request.user.pk))
+        versions = sorted(get_versions(*tags).items())
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        signature = hashlib.md5(
+            json.dumps([
+                request.get_host(),
+                request.path,
+                query,
+                request.user.pk,
+                versions,
+            ]).encode()
+        ).hexdigest()
+        return f'"{signature}"'
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().list, request,
+                                             *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(super().retrieve, request,
+                                             *args, **kwargs)
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+        return response
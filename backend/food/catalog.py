@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from .cache import INGREDIENTS_TAG, get_version
+from .models import Ingredient
+from .serializers import IngredientSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOG_KEY = 'catalog:ingredients'
+CATALOG_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class IngredientCatalog:
+    """
+    Снимок справочника ингредиентов: сериализованный JSON и его
+    заранее сжатые варианты. digest — хеш содержимого, он входит в URL
+    снимка, поэтому ответ по такому URL можно кешировать навсегда.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.digest = hashlib.sha256(content).hexdigest()[:16]
+        self.encodings = {'gzip': gzip.compress(content, mtime=0)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(content)
+
+    def get_body(self, accept_encoding):
+        accepted = {
+            part.split(';')[0].strip()
+            for part in accept_encoding.split(',')
+            if not part.replace(' ', '').endswith(';q=0')
+        }
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self.encodings:
+                return encoding, self.encodings[encoding]
+        return None, self.content
+
+
+def build_ingredient_catalog():
+    ingredients = Ingredient.objects.order_by('name', 'id')
+    data = IngredientSerializer(ingredients, many=True).data
+    return IngredientCatalog(JSONRenderer().render(data))
+
+
+_catalog = None
+_catalog_version = None
+
+
+def get_ingredient_catalog():
+    """
+    Возвращает снимок для текущей версии справочника. Снимок строится
+    один раз на версию и хранится в общем кеше и в памяти процесса.
+    В общем кеше лежит только последний снимок: ключ постоянный, а
+    версия хранится вместе со снимком, поэтому старые снимки не
+    накапливаются.
+    """
+    global _catalog, _catalog_version
+
+    version = get_version(INGREDIENTS_TAG)
+    if _catalog is None or _catalog_version != version:
+        cached_version, catalog = cache.get(CATALOG_KEY, (None, None))
+        if cached_version != version:
+            catalog = build_ingredient_catalog()
+            cache.set(CATALOG_KEY, (version, catalog), timeout=None)
+        _catalog, _catalog_version = catalog, version
+    return _catalog
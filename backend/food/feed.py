@@ -0,0 +1,138 @@
+import heapq
+from itertools import dropwhile, islice
+
+from .cache import (
+    author_recipes_tag,
+    get_generation,
+    get_many_cached_data,
+    set_many_cached_data,
+)
+from .models import Recipe
+from .pagination import (
+    DEFAULT_KEYSET_ORDERING,
+    KeysetPagination,
+    RecipePagination,
+)
+
+TIMELINE_KEY_PREFIX = 'timeline:author:'
+TIMELINE_SIZE = 100
+TIMELINE_TIMEOUT = 24 * 60 * 60
+SQL_MAX_AUTHORS = 10
+
+
+def get_timeline_key(author_id):
+    return f'{TIMELINE_KEY_PREFIX}{author_id}'
+
+
+def get_author_timelines(author_ids):
+    """
+    Возвращает {author_id: [(created_at, id), ...]} — последние
+    TIMELINE_SIZE рецептов каждого автора от новых к старым. Списки
+    хранятся в кеше, промахи добираются одним запросом.
+    """
+    generation = get_generation()
+    keys = {author_id: get_timeline_key(author_id) for author_id in author_ids}
+    cached = get_many_cached_data(list(keys.values()))
+    timelines = {
+        author_id: cached[key]
+        for author_id, key in keys.items() if key in cached
+    }
+
+    missing = [author_id for author_id in author_ids
+               if author_id not in timelines]
+    if missing:
+        for author_id in missing:
+            timelines[author_id] = []
+        rows = (
+            Recipe.objects.latest_per_author(missing, TIMELINE_SIZE)
+            .values_list('author_id', 'created_at', 'id')
+        )
+        for author_id, created_at, recipe_id in rows:
+            timelines[author_id].append((created_at, recipe_id))
+        set_many_cached_data(
+            {
+                keys[author_id]: (timelines[author_id],
+                                  [author_recipes_tag(author_id)])
+                for author_id in missing
+            },
+            TIMELINE_TIMEOUT,
+            generation,
+        )
+    return timelines
+
+
+def merge_timelines(author_ids, position=None, limit=None):
+    """
+    Сливает ленты авторов k-путевым слиянием через кучу и возвращает
+    первые limit пар (created_at, id) после позиции курсора.
+
+    Лента автора в кеше обрезана до TIMELINE_SIZE записей, поэтому
+    результат верен только до самой новой из последних записей обрезанных
+    лент. Если страница заходит глубже, возвращается None.
+    """
+    timelines = get_author_timelines(author_ids)
+    horizon = max(
+        (timeline[-1] for timeline in timelines.values()
+         if len(timeline) >= TIMELINE_SIZE),
+        default=None,
+    )
+    if position is not None:
+        position = tuple(position)
+        timelines = {
+            author_id: dropwhile(lambda entry: entry >= position, timeline)
+            for author_id, timeline in timelines.items()
+        }
+
+    entries = list(islice(
+        heapq.merge(*timelines.values(), reverse=True), limit
+    ))
+    if horizon is not None and (
+        len(entries) != limit or entries[-1] < horizon
+    ):
+        return None
+    return entries
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    Курсорная пагинация ленты подписок. Страница собирается слиянием
+    закешированных лент авторов; при небольшом числе подписок или выходе
+    за глубину кеша используется запрос по индексу (author, created_at).
+    """
+
+    def __init__(self, page_size, author_ids):
+        super().__init__(page_size)
+        self.author_ids = author_ids
+
+    def get_ordering(self, view):
+        return DEFAULT_KEYSET_ORDERING
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if len(self.author_ids) <= SQL_MAX_AUTHORS:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        position = self.decode_cursor(request, queryset.model)
+        entries = merge_timelines(self.author_ids, position,
+                                  self.page_size + 1)
+        if entries is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        recipe_ids = [recipe_id for _, recipe_id in entries]
+        recipes = queryset.in_bulk(recipe_ids[:self.page_size])
+        self.has_next = len(recipe_ids) > self.page_size
+        self.page = [
+            recipes[recipe_id] for recipe_id in recipe_ids[:self.page_size]
+            if recipe_id in recipes
+        ]
+        return self.page
+
+
+class FeedPagination(RecipePagination):
+    """Лента листается только курсором, номера страниц не поддерживаются."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = TimelinePagination(self.get_page_size(request),
+                                         view.feed_author_ids)
+        return self.keyset.paginate_queryset(queryset, request, view)
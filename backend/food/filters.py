@@ -1,8 +1,12 @@
 import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
 from django_filters import rest_framework
 from django_filters.rest_framework import FilterSet
 
 from .models import Ingredient, Recipe
+from .ranking import RANKING_ORDERINGS
+from .services import SEARCH_CONFIG
 
 
 class IngredientFilter(FilterSet):
@@ -18,10 +22,29 @@ class RecipeFilter(django_filters.FilterSet):
     is_in_shopping_cart = django_filters.NumberFilter(
         method='filter_is_in_shopping_cart')
     author = django_filters.NumberFilter(field_name='author__id')
+    search = django_filters.CharFilter(method='filter_search')
+    ordering = django_filters.ChoiceFilter(
+        choices=[(name, name) for name in RANKING_ORDERINGS],
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['author', 'is_favorited', 'is_in_shopping_cart', 'search',
+                  'ordering']
+
+    def filter_search(self, recipes_queryset, name, value):
+        query = SearchQuery(value, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return (
+            recipes_queryset
+            .filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-created_at')
+        )
+
+    def filter_ordering(self, recipes_queryset, name, value):
+        return recipes_queryset.order_by(*RANKING_ORDERINGS[value])
 
     def filter_is_favorited(self, recipes_queryset, name, value):
         user = self.request.user
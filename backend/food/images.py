@@ -0,0 +1,178 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate_tags
+from .services import (
+    change_media_references,
+    get_media_changes,
+    get_media_names,
+)
+
+try:
+    import pillow_avif  # noqa: F401  регистрирует формат AVIF в Pillow
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (
+    ('thumbnail', 160),
+    ('card', 480),
+    ('full', 1280),
+)
+RENDITION_FORMATS = (
+    ('image/avif', 'AVIF', 'avif', {'quality': 60}),
+    ('image/webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('image/jpeg', 'JPEG', 'jpg',
+     {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+
+
+def get_rendition_formats():
+    Image.init()
+    return [
+        rendition_format for rendition_format in RENDITION_FORMATS
+        if rendition_format[1] in Image.SAVE
+    ]
+
+
+def _prepare(image, pil_format):
+    """
+    Возвращает копию картинки без метаданных в подходящем для формата
+    цветовом режиме. Для JPEG прозрачность заливается белым.
+    """
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    if has_alpha:
+        image = image.convert('RGBA')
+        if pil_format == 'JPEG':
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+    else:
+        image = image.convert('RGB')
+    image.info = {}
+    return image
+
+
+def generate_renditions(field_file):
+    """
+    Сохраняет уменьшенные копии картинки в подкаталог renditions/
+    каталога загрузки поля и возвращает
+    {'source': имя оригинала, 'variants': {mime: [[имя, ширина], ...]}}.
+    """
+    storage = field_file.storage
+    directory = os.path.join(str(field_file.field.upload_to), 'renditions')
+    stem = os.path.splitext(os.path.basename(field_file.name))[0]
+
+    with storage.open(field_file.name) as source:
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+
+    variants = {}
+    for media_type, pil_format, extension, options in (
+        get_rendition_formats()
+    ):
+        prepared = _prepare(image, pil_format)
+        widths = set()
+        for size_name, width in RENDITION_WIDTHS:
+            rendition = prepared.copy()
+            rendition.thumbnail((width, width), Image.LANCZOS)
+            if rendition.width in widths:
+                continue
+            widths.add(rendition.width)
+
+            buffer = BytesIO()
+            rendition.save(buffer, pil_format, **options)
+            name = storage.save(
+                os.path.join(directory, f'{stem}_{size_name}.{extension}'),
+                ContentFile(buffer.getvalue()),
+            )
+            variants.setdefault(media_type, []).append(
+                [name, rendition.width]
+            )
+    return {'source': field_file.name, 'variants': variants}
+
+
+def process_renditions(model, pk, field_name, renditions_field, tags):
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        field_file = instance and getattr(instance, field_name)
+        if not field_file:
+            return
+        renditions = generate_renditions(field_file)
+        with transaction.atomic():
+            updated = model.objects.filter(
+                pk=pk, **{field_name: field_file.name}
+            ).update(**{renditions_field: renditions})
+            if updated:
+                change_media_references(get_media_changes(
+                    get_media_names(None, getattr(instance,
+                                                  renditions_field)),
+                    get_media_names(None, renditions),
+                ))
+                invalidate_tags(*tags)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s #%s',
+                         model._meta.label, pk)
+
+
+def _run_in_thread(func, *args):
+    try:
+        func(*args)
+    finally:
+        connections.close_all()
+
+
+_executor = None
+
+
+def submit(func, *args):
+    """
+    Выполняет задачу в фоновом пуле потоков. При
+    IMAGE_RENDITION_WORKERS = 0 задача выполняется сразу.
+    """
+    global _executor
+
+    if not settings.IMAGE_RENDITION_WORKERS:
+        func(*args)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS,
+            thread_name_prefix='renditions',
+        )
+    _executor.submit(_run_in_thread, func, *args)
+
+
+def schedule_renditions(instance, field_name, renditions_field, tags):
+    """
+    Ставит картинку в очередь на обработку после фиксации транзакции,
+    если варианты ещё не построены для текущего файла.
+    """
+    field_file = getattr(instance, field_name)
+    renditions = getattr(instance, renditions_field) or {}
+    model = type(instance)
+
+    if not field_file:
+        # Ссылки на варианты снимает обработчик update_media_references,
+        # сравнивая имена до и после сохранения.
+        if renditions:
+            setattr(instance, renditions_field, {})
+            model.objects.filter(pk=instance.pk).update(
+                **{renditions_field: {}}
+            )
+            invalidate_tags(*tags)
+        return
+    if renditions.get('source') == field_file.name:
+        return
+
+    args = (model, instance.pk, field_name, renditions_field, list(tags))
+    transaction.on_commit(lambda: submit(process_renditions, *args))
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from food.models import MediaFile
+from food.services import get_media_fields, rebuild_media_references
+
+
+class Command(BaseCommand):
+    help = 'Delete media files that are no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recount references from the database first',
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=60 * 60,
+            help='Keep orphans younger than this many seconds',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report files that would be deleted',
+        )
+
+    def get_upload_directories(self):
+        return {
+            model._meta.get_field(field_name).upload_to.rstrip('/')
+            for model, field_name, _ in get_media_fields()
+        }
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            with transaction.atomic():
+                rebuild_media_references()
+
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        orphans = list(
+            MediaFile.objects
+            .filter(reference_count__lte=0, updated_at__lt=cutoff)
+            .values_list('pk', 'name')
+        )
+        deleted = 0
+        for pk, name in orphans:
+            if not options['dry_run']:
+                count, _ = MediaFile.objects.filter(
+                    pk=pk, reference_count__lte=0
+                ).delete()
+                if not count:
+                    continue
+                default_storage.delete(name)
+            deleted += 1
+            self.stdout.write(name)
+
+        tracked = set(MediaFile.objects.values_list('name', flat=True))
+        for directory in self.get_upload_directories():
+            if not default_storage.exists(directory):
+                continue
+            for name in default_storage.walk(directory):
+                if name in tracked:
+                    continue
+                if default_storage.get_modified_time(name) >= cutoff:
+                    continue
+                if not options['dry_run']:
+                    default_storage.delete(name)
+                deleted += 1
+                self.stdout.write(name)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} files'))
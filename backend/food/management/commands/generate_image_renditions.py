@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from food.cache import RECIPES_TAG, USERS_TAG, recipe_tag, user_tag
+from food.images import process_renditions
+from food.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Generate missing image renditions for recipes and avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate renditions even if they are up to date',
+        )
+
+    def get_targets(self):
+        return (
+            (Recipe, 'image', 'image_renditions',
+             lambda pk: [recipe_tag(pk), RECIPES_TAG]),
+            (get_user_model(), 'avatar', 'avatar_renditions',
+             lambda pk: [user_tag(pk), USERS_TAG]),
+        )
+
+    def handle(self, *args, **options):
+        for model, field_name, renditions_field, get_tags in (
+            self.get_targets()
+        ):
+            rows = (
+                model.objects
+                .exclude(**{f'{field_name}__isnull': True})
+                .exclude(**{field_name: ''})
+                .values_list('pk', field_name, renditions_field)
+            )
+            pks = [
+                pk for pk, name, renditions in rows
+                if options['force'] or renditions.get('source') != name
+            ]
+            for pk in pks:
+                process_renditions(model, pk, field_name, renditions_field,
+                                   get_tags(pk))
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Processed {len(pks)} {model._meta.verbose_name_plural}'
+                )
+            )
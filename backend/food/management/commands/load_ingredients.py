@@ -1,5 +1,7 @@
 import json
 from django.core.management.base import BaseCommand
+from food.autocomplete import invalidate_ingredient_index
+from food.catalog import get_ingredient_catalog
 from food.models import Ingredient
 from django.conf import settings
 import os
@@ -20,6 +22,8 @@ class Command(BaseCommand):
                 Ingredient.objects.bulk_create(ingredients,
                                                ignore_conflicts=True)
                 after_count = Ingredient.objects.count()
+                invalidate_ingredient_index()
+                get_ingredient_catalog()
                 created_count = after_count - before_count
 
                 self.stdout.write(
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from food.services import (
+    get_expected_shopping_list_items,
+    get_stored_shopping_list_items,
+    rebuild_shopping_lists,
+)
+
+
+class Command(BaseCommand):
+    help = 'Check shopping list aggregates for drift and rebuild them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drift without rebuilding',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = get_expected_shopping_list_items()
+            stored = get_stored_shopping_list_items()
+            drifted = {
+                key for key in expected.keys() | stored.keys()
+                if expected.get(key) != stored.get(key)
+            }
+
+            if not drifted:
+                self.stdout.write(
+                    self.style.SUCCESS('Shopping lists are consistent')
+                )
+                return
+
+            message = f'Found {len(drifted)} drifted shopping list items'
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+
+            rebuild_shopping_lists(expected)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Rebuilt {len(expected)} shopping list items'
+                )
+            )
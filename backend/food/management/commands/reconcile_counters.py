@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from food.services import get_drifted_counters, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Check denormalized counters for drift and recalculate them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drift without recalculating',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = get_drifted_counters()
+
+            if not drifted:
+                self.stdout.write(self.style.SUCCESS('Counters are consistent'))
+                return
+
+            for (model, field), count in drifted.items():
+                self.stdout.write(self.style.WARNING(
+                    f'{model._meta.label}.{field}: {count} drifted rows'
+                ))
+            message = f'Found {sum(drifted.values())} drifted counters'
+            if options['check']:
+                raise CommandError(message)
+
+            reconcile_counters()
+            self.stdout.write(self.style.SUCCESS('Recalculated counters'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from food.ranking import update_rankings
+
+
+class Command(BaseCommand):
+    help = 'Apply favorites and shopping cart additions to recipe rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recalculate trending scores from all relations',
+        )
+
+    def handle(self, *args, **options):
+        trending, popular = update_rankings(rebuild=options['rebuild'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Updated trending score of {trending} recipes '
+                f'and popularity of {popular} recipes'
+            )
+        )
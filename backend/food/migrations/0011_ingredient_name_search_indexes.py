@@ -0,0 +1,27 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0010_shoppinglistitem'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX food_ingredient_name_prefix_idx '
+                'ON food_ingredient (UPPER(name::text) text_pattern_ops);'
+            ),
+            reverse_sql='DROP INDEX food_ingredient_name_prefix_idx;',
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX food_ingredient_name_trgm_idx '
+                'ON food_ingredient USING gin (UPPER(name::text) gin_trgm_ops);'
+            ),
+            reverse_sql='DROP INDEX food_ingredient_name_trgm_idx;',
+        ),
+    ]
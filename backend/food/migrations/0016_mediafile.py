@@ -0,0 +1,58 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:27
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_media_files(apps, schema_editor):
+    Recipe = apps.get_model('food', 'Recipe')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    MediaFile = apps.get_model('food', 'MediaFile')
+
+    references = Counter()
+    sources = (
+        Recipe.objects.values_list('image', 'image_renditions'),
+        User.objects.values_list('avatar', 'avatar_renditions'),
+    )
+    for rows in sources:
+        for name, renditions in rows.iterator():
+            if name:
+                references[name] += 1
+            for variants in (renditions or {}).get('variants', {}).values():
+                references.update(variant[0] for variant in variants)
+
+    MediaFile.objects.bulk_create(
+        [
+            MediaFile(name=name, reference_count=count)
+            for name, count in references.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0009_user_avatar_renditions'),
+        ('food', '0015_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('reference_count', models.IntegerField(default=0, verbose_name='Количество ссылок')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+            },
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
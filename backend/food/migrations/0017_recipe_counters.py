@@ -0,0 +1,57 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('food', 'Recipe')
+    Favorite = apps.get_model('food', 'Favorite')
+    ShoppingCart = apps.get_model('food', 'ShoppingCart')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Subscription = apps.get_model('users', 'Subscription')
+
+    counters = (
+        (Favorite, 'recipe', Recipe, 'favorites_count'),
+        (ShoppingCart, 'recipe', Recipe, 'shopping_carts_count'),
+        (Recipe, 'author', User, 'recipes_count'),
+        (Subscription, 'author', User, 'subscribers_count'),
+        (Subscription, 'follower', User, 'subscriptions_count'),
+    )
+    for relation_model, relation_field, model, field in counters:
+        model.objects.update(**{field: Coalesce(
+            Subquery(
+                relation_model.objects
+                .filter(**{relation_field: OuterRef('pk')})
+                .order_by()
+                .values(relation_field)
+                .annotate(count=Count('pk'))
+                .values('count')
+            ),
+            0,
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0010_user_counters'),
+        ('food', '0016_mediafile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:42
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+import django.utils.timezone
+
+
+def start_rankings(apps, schema_editor):
+    """
+    Популярность заполняется по счётчикам. У существующих связей нет
+    настоящей даты добавления, поэтому рейтинг в трендах начинается
+    с нуля, а отметка обработки ставится на момент миграции.
+    """
+    Recipe = apps.get_model('food', 'Recipe')
+    RankingCheckpoint = apps.get_model('food', 'RankingCheckpoint')
+
+    Recipe.objects.update(
+        popularity_score=F('favorites_count') * 2 + F('shopping_carts_count')
+    )
+    now = timezone.now()
+    RankingCheckpoint.objects.create(processed_until=now, epoch=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0017_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processed_until', models.DateTimeField(null=True, verbose_name='Обработано до')),
+                ('epoch', models.DateTimeField(verbose_name='Точка отсчёта рейтинга')),
+            ],
+            options={
+                'verbose_name': 'состояние рейтинга',
+                'verbose_name_plural': 'Состояние рейтинга',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity_score',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг в трендах'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['created_at'], name='favorite_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity_score', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['created_at'], name='shoppingcart_created_at_idx'),
+        ),
+        migrations.RunPython(start_rankings, migrations.RunPython.noop),
+    ]
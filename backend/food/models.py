@@ -1,6 +1,11 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.db.models.expressions import RawSQL
+from users.models import CounterFieldsMixin
 
 User = get_user_model()
 
@@ -18,7 +23,65 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self, user):
+        return self.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user),
+            ),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def for_user(self, user):
+        return self.with_related(user).with_user_flags(user)
+
+    def latest_per_author(self, author_ids, limit=None):
+        """
+        Последние limit рецептов каждого из авторов: номера строк
+        считаются оконной функцией ROW_NUMBER() в одном подзапросе.
+        """
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is not None:
+            table = self.model._meta.db_table
+            queryset = queryset.filter(pk__in=RawSQL(
+                f"""
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY author_id
+                        ORDER BY created_at DESC, id DESC
+                    ) AS position
+                    FROM {table}
+                    WHERE author_id = ANY(%s)
+                ) ranked
+                WHERE position <= %s
+                """,
+                (list(author_ids), limit),
+            ))
+        return queryset.order_by('-created_at', '-id')
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -27,6 +90,8 @@ class Recipe(models.Model):
     )
     name = models.CharField('Название', max_length=256)
     image = models.ImageField('Картинка', upload_to='recipes/')
+    image_renditions = models.JSONField('Варианты картинки', default=dict,
+                                        blank=True, editable=False)
     text = models.TextField('Описание')
     cooking_time = models.PositiveIntegerField(
         'Время приготовления в минутах',
@@ -36,6 +101,23 @@ class Recipe(models.Model):
                                          through='IngredientRecipe',
                                          related_name='recipes')
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField('В избранном', default=0,
+                                                  editable=False)
+    shopping_carts_count = models.PositiveIntegerField('В корзинах',
+                                                       default=0,
+                                                       editable=False)
+    popularity_score = models.PositiveIntegerField('Популярность', default=0,
+                                                   editable=False)
+    trending_score = models.FloatField('Рейтинг в трендах', default=0,
+                                       editable=False)
+    search_vector = SearchVectorField('Поисковый вектор', null=True,
+                                      editable=False)
+
+    counter_fields = ('favorites_count', 'shopping_carts_count',
+                      'popularity_score', 'trending_score')
+
+    objects = RecipeQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -44,6 +126,17 @@ class Recipe(models.Model):
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='recipe_created_at_idx'),
+            models.Index(fields=['author', '-created_at'],
+                         name='recipe_author_created_at_idx'),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+            models.Index(fields=['-popularity_score', '-id'],
+                         name='recipe_popularity_idx'),
+            models.Index(fields=['-trending_score', '-id'],
+                         name='recipe_trending_idx'),
+        ]
 
 
 class IngredientRecipe(models.Model):
@@ -66,6 +159,11 @@ class IngredientRecipe(models.Model):
                 name='unique_ingredient_recipe'
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'ingredient'],
+                         include=['amount'],
+                         name='ingredient_recipe_recipe_idx'),
+        ]
 
     def __str__(self):
         return f'{self.ingredient} {self.recipe}'
@@ -82,6 +180,7 @@ class UserRecipeRelation(models.Model):
         on_delete=models.CASCADE,
         related_name='%(class)s_relations'
     )
+    created_at = models.DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         abstract = True
@@ -91,6 +190,12 @@ class UserRecipeRelation(models.Model):
                 name='unique_%(class)s'
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='%(class)s_recipe_user_idx'),
+            models.Index(fields=['created_at'],
+                         name='%(class)s_created_at_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
@@ -108,3 +213,59 @@ class ShoppingCart(UserRecipeRelation):
         verbose_name = 'корзина'
         verbose_name_plural = 'Корзины'
         default_related_name = 'shopping_carts'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list_items'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items'
+    )
+    total_amount = models.PositiveIntegerField('Общее количество', default=0)
+    recipe_count = models.PositiveIntegerField('Количество рецептов',
+                                               default=0)
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.total_amount}'
+
+
+class MediaFile(models.Model):
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    reference_count = models.IntegerField('Количество ссылок', default=0)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return f'{self.name}: {self.reference_count}'
+
+
+class RankingCheckpoint(models.Model):
+    processed_until = models.DateTimeField('Обработано до', null=True)
+    epoch = models.DateTimeField('Точка отсчёта рейтинга')
+
+    class Meta:
+        verbose_name = 'состояние рейтинга'
+        verbose_name_plural = 'Состояние рейтинга'
+
+    def __str__(self):
+        return f'{self.processed_until}'
@@ -1,6 +1,224 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import get_versions
+
+DEFAULT_KEYSET_ORDERING = ('-created_at', '-id')
+RECIPES_COUNT_VERSION = 'recipes:count'
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу: следующая страница выбирается условием на значения
+    полей сортировки последней записи, без OFFSET и без COUNT(*).
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering())
+        return DEFAULT_KEYSET_ORDERING
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_position_filter(self, position):
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_position(self, instance):
+        return [
+            _encode_value(getattr(instance, field.lstrip('-')))
+            for field in self.ordering
+        ]
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(
+                base64.urlsafe_b64decode(encoded.encode()).decode()
+            )
+            if len(position) != len(self.ordering):
+                raise ValueError
+            return [
+                self.to_python(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            return value
+
+    def encode_cursor(self, position):
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode())
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   encoded.decode())
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
 
 
 class RecipePagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = KeysetPagination.cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination(self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+def get_user_count_version(user_id):
+    return f'{RECIPES_COUNT_VERSION}:user:{user_id}'
+
+
+def get_estimated_count(model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+class CachedCountPaginator(Paginator):
+    def __init__(self, object_list, per_page, cache_key,
+                 cache_timeout, estimate_threshold=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.cache_timeout = cache_timeout
+        self.estimate_threshold = estimate_threshold
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.cache_key)
+        if count is not None:
+            return count
+
+        if self.estimate_threshold is not None:
+            estimate = get_estimated_count(self.object_list.model)
+            if estimate > self.estimate_threshold:
+                count = estimate
+        if count is None:
+            count = super().count
+
+        cache.set(self.cache_key, count, self.cache_timeout)
+        return count
+
+
+class CachedCountPagination(RecipePagination):
+    """
+    Кеширует COUNT(*) по сигнатуре фильтров на count_timeout секунд.
+    Для ленты без фильтров выше estimate_threshold строк берётся оценка
+    pg_class.reltuples.
+    """
+
+    count_timeout = 30
+    estimate_threshold = 100_000
+    ignored_params = ('page', 'limit', 'format')
+    user_dependent_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.filter_params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            if key not in self.ignored_params
+            for value in values
+        )
+        self.user_id = None
+        if any(key in self.user_dependent_params
+               for key, _ in self.filter_params):
+            self.user_id = request.user.pk
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_cache_key(self):
+        names = [RECIPES_COUNT_VERSION]
+        if self.user_id:
+            names.append(get_user_count_version(self.user_id))
+        versions = sorted(get_versions(*names).items())
+        signature = hashlib.md5(
+            json.dumps([self.user_id, self.filter_params, versions]).encode()
+        ).hexdigest()
+        return f'{RECIPES_COUNT_VERSION}:{signature}'
+
+    def django_paginator_class(self, object_list, per_page):
+        return CachedCountPaginator(
+            object_list,
+            per_page,
+            cache_key=self.get_count_cache_key(),
+            cache_timeout=self.count_timeout,
+            estimate_threshold=(
+                None if self.filter_params else self.estimate_threshold
+            ),
+        )
@@ -0,0 +1,171 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import RANKING_TAG, invalidate_tags
+from .models import Favorite, RankingCheckpoint, Recipe, ShoppingCart
+
+RANKING_ORDERINGS = {
+    'popular': ('-popularity_score', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+RANKING_WEIGHTS = (
+    (Favorite, 'favorites_count', 2),
+    (ShoppingCart, 'shopping_carts_count', 1),
+)
+RANKING_EVENT_WEIGHTS = {model: weight for model, _, weight in RANKING_WEIGHTS}
+TRENDING_HALF_LIFE = timedelta(days=3)
+# Связи, добавленные за последние секунды, могут ещё не быть
+# зафиксированы, поэтому обработка отстаёт от текущего времени.
+PROCESSING_LAG = timedelta(seconds=30)
+REBASE_AFTER = 20 * TRENDING_HALF_LIFE
+
+EVENTS_SQL = """
+    SELECT recipe_id, created_at, %s::float AS weight
+    FROM {table}
+    WHERE (%s::timestamptz IS NULL OR created_at > %s) AND created_at <= %s
+"""
+
+APPLY_TRENDING_EVENTS_SQL = """
+    UPDATE {recipes} recipe
+    SET trending_score = recipe.trending_score + delta.score
+    FROM (
+        SELECT event.recipe_id, SUM(event.weight * POWER(
+            2, EXTRACT(EPOCH FROM event.created_at - %s)::float / %s
+        )) AS score
+        FROM ({events}) event
+        GROUP BY event.recipe_id
+    ) delta
+    WHERE recipe.id = delta.recipe_id
+"""
+
+REBASE_TRENDING_SQL = """
+    UPDATE {recipes} SET trending_score = trending_score * POWER(2, %s)
+    WHERE trending_score > 0
+"""
+
+REMOVE_EVENT_SQL = """
+    UPDATE {recipes} recipe SET
+        popularity_score = GREATEST(recipe.popularity_score - %s, 0),
+        trending_score = GREATEST(recipe.trending_score - %s * POWER(
+            2, EXTRACT(EPOCH FROM %s::timestamptz - checkpoint.epoch)::float / %s
+        ), 0)
+    FROM {checkpoints} checkpoint
+    WHERE recipe.id = %s AND checkpoint.processed_until >= %s
+"""
+
+
+def _get_half_lives(delta):
+    return delta.total_seconds() / TRENDING_HALF_LIFE.total_seconds()
+
+
+def get_popularity_score():
+    return sum(F(field) * weight for _, field, weight in RANKING_WEIGHTS)
+
+
+def apply_trending_events(since, until, epoch):
+    """
+    Добавляет к рейтингу вклад связей, созданных в (since, until].
+    Вклад связи равен весу, умноженному на 2 ** ((created_at - epoch) /
+    период полураспада): рейтинги хранятся приведёнными к общей точке
+    отсчёта, поэтому старые значения не нужно пересчитывать при каждом
+    запуске, а порядок совпадает с порядком по затухающему рейтингу.
+    """
+    events = []
+    params = []
+    for model, _, weight in RANKING_WEIGHTS:
+        events.append(EVENTS_SQL.format(table=model._meta.db_table))
+        params += [weight, since, since, until]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            APPLY_TRENDING_EVENTS_SQL.format(
+                recipes=Recipe._meta.db_table,
+                events=' UNION ALL '.join(events),
+            ),
+            [epoch, TRENDING_HALF_LIFE.total_seconds(), *params],
+        )
+        return cursor.rowcount
+
+
+def remove_ranking_event(relation):
+    """
+    Вычитает из рейтингов вклад удалённой связи. Связи, которые ещё не
+    обработаны update_rankings, в рейтингах не учтены и не вычитаются.
+    """
+    weight = RANKING_EVENT_WEIGHTS[type(relation)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            REMOVE_EVENT_SQL.format(
+                recipes=Recipe._meta.db_table,
+                checkpoints=RankingCheckpoint._meta.db_table,
+            ),
+            [weight, weight, relation.created_at,
+             TRENDING_HALF_LIFE.total_seconds(), relation.recipe_id,
+             relation.created_at],
+        )
+        return cursor.rowcount
+
+
+def rebase_trending_scores(epoch, new_epoch):
+    """Переносит точку отсчёта, чтобы множители не росли бесконечно."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            REBASE_TRENDING_SQL.format(recipes=Recipe._meta.db_table),
+            [-_get_half_lives(new_epoch - epoch)],
+        )
+
+
+def update_popularity_scores(since=None, until=None):
+    """
+    Пересчитывает популярность рецептов, у которых появились связи
+    в (since, until]; без since — всех рецептов. Удалённые связи
+    вычитаются сразу, в remove_ranking_event.
+    """
+    score = get_popularity_score()
+    recipes = Recipe.objects.exclude(popularity_score=score)
+    if since is not None:
+        changed = Q()
+        for model, _, _ in RANKING_WEIGHTS:
+            changed |= Q(pk__in=model.objects.filter(
+                created_at__gt=since, created_at__lte=until
+            ).values('recipe_id'))
+        recipes = recipes.filter(changed)
+    return recipes.update(popularity_score=score)
+
+
+@transaction.atomic
+def update_rankings(rebuild=False):
+    """
+    Обрабатывает связи, добавленные с прошлого запуска, и обновляет
+    рейтинги. При rebuild рейтинг в трендах считается заново по всем
+    связям. Возвращает число рецептов, у которых изменился рейтинг
+    в трендах и популярность.
+    """
+    until = timezone.now() - PROCESSING_LAG
+    checkpoint = RankingCheckpoint.objects.select_for_update().first()
+    if checkpoint is None:
+        checkpoint = RankingCheckpoint(epoch=until)
+        rebuild = True
+
+    if rebuild:
+        Recipe.objects.exclude(trending_score=0).update(trending_score=0)
+        checkpoint.processed_until = None
+        checkpoint.epoch = until
+    elif until - checkpoint.epoch > REBASE_AFTER:
+        rebase_trending_scores(checkpoint.epoch, until)
+        checkpoint.epoch = until
+
+    since = checkpoint.processed_until
+    if since is not None and since >= until:
+        return 0, 0
+    trending = apply_trending_events(since, until, checkpoint.epoch)
+    popular = update_popularity_scores(since, until)
+
+    checkpoint.processed_until = until
+    checkpoint.save()
+    if trending or popular:
+        invalidate_tags(RANKING_TAG)
+    return trending, popular
@@ -8,19 +8,152 @@ from .models import (
     ShoppingCart,
     Ingredient)
 import base64
-from django.core.files.base import ContentFile
+import binascii
+import re
+from tempfile import SpooledTemporaryFile
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from users.models import Subscription
+from .cache import (
+    FRAGMENT_KEY_PREFIX,
+    get_many_cached_data,
+    recipe_tag,
+    set_many_cached_data,
+    user_tag,
+)
+from .bulk import MAX_BULK_IMPORT_SIZE, MAX_BULK_RECIPE_IDS
+from .services import set_recipe_ingredients
 from django.core.validators import RegexValidator
+from PIL import Image
+
+BASE64_MARKER = ';base64,'
+BASE64_CHUNK_SIZE = 64 * 1024
+BASE64_WHITESPACE = re.compile(r'\s+')
+SRCSET_PARAM = 'srcset'
+IMAGE_SPOOL_SIZE = 1024 * 1024
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
 
 
 class Base64ImageField(serializers.ImageField):
+    """
+    Картинка в виде data URI. base64 декодируется частями во временный
+    файл, который уходит на диск после IMAGE_SPOOL_SIZE байт. Размер
+    проверяется по ходу декодирования, а Pillow читает только заголовок.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные base64.',
+        'max_size': 'Размер картинки не должен превышать {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            return self.decode(data)
         return super().to_internal_value(data)
 
+    def decode_chunks(self, data, start):
+        """
+        Декодирует data[start:] частями. Клиенты могут переносить base64
+        по строкам (MIME, PEM), поэтому пробельные символы убираются из
+        каждой части, а хвост, не кратный четырём символам, переносится
+        в следующую.
+        """
+        carry = ''
+        for position in range(start, len(data), BASE64_CHUNK_SIZE):
+            chunk = carry + data[position:position + BASE64_CHUNK_SIZE]
+            if BASE64_WHITESPACE.search(chunk):
+                chunk = BASE64_WHITESPACE.sub('', chunk)
+            end = len(chunk) - len(chunk) % 4
+            carry = chunk[end:]
+            try:
+                yield base64.b64decode(chunk[:end], validate=True)
+            except binascii.Error:
+                self.fail('invalid_base64')
+        if carry:
+            self.fail('invalid_base64')
+
+    def decode(self, data):
+        start = data.find(BASE64_MARKER)
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(BASE64_MARKER)
+
+        max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+        if (len(data) - start) * 3 // 4 - 2 > max_size:
+            self.fail('max_size', max_size=max_size)
+
+        buffer = SpooledTemporaryFile(max_size=IMAGE_SPOOL_SIZE)
+        try:
+            size = 0
+            for chunk in self.decode_chunks(data, start):
+                size += len(chunk)
+                if size > max_size:
+                    self.fail('max_size', max_size=max_size)
+                buffer.write(chunk)
+
+            buffer.seek(0)
+            try:
+                with Image.open(buffer) as image:
+                    extension = IMAGE_FORMATS.get(image.format)
+            except (OSError, Image.DecompressionBombError):
+                extension = None
+            if extension is None:
+                self.fail('invalid_image')
+        except serializers.ValidationError:
+            buffer.close()
+            raise
+
+        buffer.seek(0)
+        image_file = File(buffer, name=f'temp.{extension}')
+        image_file.size = size
+        return image_file
+
+
+class ImageSrcsetField(serializers.Field):
+    """
+    Готовые варианты картинки в виде {mime: srcset}. Пока картинка
+    обрабатывается, отдаётся пустой словарь.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, renditions):
+        request = self.context.get('request')
+        srcset = {}
+        for media_type, variants in renditions.get('variants', {}).items():
+            urls = []
+            for name, width in variants:
+                url = default_storage.url(name)
+                if request:
+                    url = request.build_absolute_uri(url)
+                urls.append(f'{url} {width}w')
+            srcset[media_type] = ', '.join(urls)
+        return srcset
+
+
+class SrcsetFieldsMixin:
+    """
+    Поля ImageSrcsetField отдаются только по запросу с ?srcset=1, чтобы
+    ответы без параметра оставались в прежнем формате.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request and request.query_params.get(SRCSET_PARAM) in (
+            '1', 'true'
+        ):
+            return fields
+        return {
+            name: field for name, field in fields.items()
+            if not isinstance(field, ImageSrcsetField)
+        }
+
 
 class AvatarAddSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(required=True)
@@ -52,8 +185,9 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SrcsetFieldsMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_srcset = ImageSrcsetField(source='avatar_renditions')
 
     class Meta:
         model = User
@@ -65,10 +199,13 @@ class CustomUserSerializer(UserSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_srcset',
         )
         read_only_fields = fields 
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
@@ -95,15 +232,137 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = fields 
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(SrcsetFieldsMixin,
+                            serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField(source='image_renditions')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
         read_only_fields = fields 
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class AuthorFragmentSerializer(serializers.ModelSerializer):
+    avatar_srcset = ImageSrcsetField(source='avatar_renditions')
+
+    class Meta:
+        model = User
+        fields = tuple(
+            field for field in CustomUserSerializer.Meta.fields
+            if field != 'is_subscribed'
+        )
+        read_only_fields = fields
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    author = AuthorFragmentSerializer(read_only=True)
+    ingredients = IngredientInRecipeSerializer(
+        many=True,
+        source='recipe_ingredients',
+        read_only=True,
+    )
+    image_srcset = ImageSrcsetField(source='image_renditions')
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'author', 'ingredients', 'name', 'image',
+                  'image_srcset', 'text', 'cooking_time')
+        read_only_fields = fields
+
+
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    """
+    Собирает список рецептов из закешированных фрагментов, одинаковых для
+    всех пользователей, и флагов текущего пользователя. Фрагменты
+    сериализуются только для промахов кеша.
+    """
+
+    fragment_version = 2
+    fragment_timeout = 60 * 60
+
+    def get_fragment_key(self, recipe):
+        # Фрагмент содержит абсолютные URL картинок, поэтому ключ зависит
+        # от схемы и хоста запроса.
+        request = self.context.get('request')
+        origin = f'{request.scheme}://{request.get_host()}' if request else ''
+        return (f'{FRAGMENT_KEY_PREFIX}recipe:{self.fragment_version}:'
+                f'{origin}:{recipe.pk}')
+
+    def get_fragments(self, recipes):
+        keys = {recipe.pk: self.get_fragment_key(recipe) for recipe in recipes}
+        fragments = get_many_cached_data(list(keys.values()))
+        missing = [
+            recipe for recipe in recipes if keys[recipe.pk] not in fragments
+        ]
+        if missing:
+            prefetch_related_objects(
+                missing,
+                'author',
+                Prefetch(
+                    'recipe_ingredients',
+                    queryset=IngredientRecipe.objects.select_related(
+                        'ingredient'
+                    ),
+                ),
+            )
+            serializer = RecipeFragmentSerializer(context=self.context)
+            new_fragments = {
+                keys[recipe.pk]: (
+                    serializer.to_representation(recipe),
+                    [recipe_tag(recipe.pk), user_tag(recipe.author_id)],
+                )
+                for recipe in missing
+            }
+            set_many_cached_data(new_fragments, self.fragment_timeout,
+                                 self.context.get('cache_generation'))
+            for key, (fragment, _) in new_fragments.items():
+                fragments[key] = fragment
+        return {recipe.pk: fragments[keys[recipe.pk]] for recipe in recipes}
+
+    def get_subscribed_author_ids(self, recipes):
+        request = self.context.get('request')
+        if not request or not request.user.is_authenticated:
+            return set()
+        return set(
+            Subscription.objects.filter(
+                follower=request.user,
+                author_id__in={recipe.author_id for recipe in recipes},
+            ).values_list('author_id', flat=True)
+        )
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        fragments = self.get_fragments(recipes)
+        subscribed = self.get_subscribed_author_ids(recipes)
+        fields = list(self.child.fields)
+        author_fields = list(self.child.fields['author'].fields)
+
+        result = []
+        for recipe in recipes:
+            fragment = fragments[recipe.pk]
+            author = dict(
+                fragment['author'],
+                is_subscribed=recipe.author_id in subscribed,
+            )
+            representation = dict(
+                fragment,
+                author={
+                    field: author[field] for field in author_fields
+                },
+                is_favorited=self.child.get_is_favorited(recipe),
+                is_in_shopping_cart=self.child.get_is_in_shopping_cart(
+                    recipe
+                ),
+            )
+            result.append({
+                field: representation[field]
+                for field in fields
+            })
+        return result
+
+
+class RecipeListSerializer(SrcsetFieldsMixin,
+                           serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
         many=True,
@@ -112,6 +371,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_srcset = ImageSrcsetField(source='image_renditions')
 
     class Meta:
         model = Recipe
@@ -123,18 +383,24 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_srcset',
             'text',
             'cooking_time',
         )
         read_only_fields = fields
+        list_serializer_class = RecipeFragmentListSerializer
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
@@ -143,9 +409,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
 
 class CreateShortIngredientsSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-    )
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(
         min_value=1,
     )
@@ -184,42 +448,99 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError("Найдены дубликаты ингредиентов")
 
+        existing_ids = self.context.get("ingredient_ids")
+        if existing_ids is None:
+            existing_ids = set(
+                Ingredient.objects.filter(id__in=ingredient_ids)
+                .values_list("id", flat=True)
+            )
+        missing_ids = [pk for pk in ingredient_ids if pk not in existing_ids]
+        if missing_ids:
+            raise serializers.ValidationError(
+                "Ингредиенты не найдены: "
+                + ", ".join(str(pk) for pk in missing_ids)
+            )
+
         return value
 
-    def set_ingredients(self, recipe, ingredients_data):
-        ingredient_instances = [
-            IngredientRecipe(
-                recipe=recipe,
-                ingredient_id=ingredient_data['id'].id,
-                amount=ingredient_data['amount'],
-            )
+    def set_ingredients(self, recipe, ingredients_data, created=False):
+        set_recipe_ingredients(recipe, {
+            ingredient_data['id']: ingredient_data['amount']
             for ingredient_data in ingredients_data
-        ]
-        IngredientRecipe.objects.bulk_create(ingredient_instances)
+        }, created)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         validated_data['author'] = self.context['request'].user
         recipe = super().create(validated_data)
-        self.set_ingredients(recipe, ingredients_data)
+        self.set_ingredients(recipe, ingredients_data, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients')
-
-        instance.ingredients.clear()
         self.set_ingredients(instance, ingredients_data)
-
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        instance = Recipe.objects.for_user(
+            self.context['request'].user
+        ).get(pk=instance.pk)
         return RecipeListSerializer(instance, context=self.context).data
 
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit and recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPE_IDS,
+    )
+
+
+class RecipeImportSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=MAX_BULK_IMPORT_SIZE,
+    )
+
+    def get_item_serializers(self):
+        """
+        Сериализаторы отдельных рецептов. Существование ингредиентов
+        всех рецептов проверяется одним запросом.
+        """
+        items = self.validated_data['recipes']
+        ingredient_ids = {
+            ingredient.get('id')
+            for item in items
+            for ingredient in item.get('ingredients') or []
+            if isinstance(ingredient, dict)
+            and isinstance(ingredient.get('id'), int)
+        }
+        context = dict(
+            self.context,
+            ingredient_ids=set(
+                Ingredient.objects.filter(id__in=ingredient_ids)
+                .values_list('id', flat=True)
+            ),
+        )
+        return [
+            RecipeCreateUpdateSerializer(data=item, context=context)
+            for item in items
+        ]
+
+
 class SubscribedUserSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(CustomUserSerializer.Meta):
         fields = CustomUserSerializer.Meta.fields + (
@@ -229,11 +550,13 @@ class SubscribedUserSerializer(CustomUserSerializer):
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes = obj.recipes.all()
-
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit and recipes_limit.isdigit():
-            recipes = recipes[:int(recipes_limit)]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes = obj.recipes.all()
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
 
         return RecipeShortSerializer(
             recipes, many=True, context={'request': request}
@@ -0,0 +1,474 @@
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+from users.models import Subscription
+
+from .cache import bump_versions, invalidate_tags, user_relations_tag
+from .models import (
+    Favorite,
+    IngredientRecipe,
+    MediaFile,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+)
+from .pagination import get_user_count_version
+
+SEARCH_CONFIG = 'russian'
+
+# Отправляется после изменения состава рецепта с аргументами recipe,
+# added ({ingredient_id: amount}), changed ({ingredient_id: (old, new)}),
+# removed ({ingredient_id: amount}) и created (рецепт только что создан).
+recipe_ingredients_changed = Signal()
+
+ADD_RECIPE_SQL = """
+    INSERT INTO {items} (user_id, ingredient_id, total_amount, recipe_count)
+    SELECT cart.user_id, ir.ingredient_id, ir.amount, 1
+    FROM {carts} cart
+    JOIN {ingredients} ir ON ir.recipe_id = cart.recipe_id
+    WHERE cart.recipe_id = %s {user_filter}
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE SET
+        total_amount = {items}.total_amount + EXCLUDED.total_amount,
+        recipe_count = {items}.recipe_count + 1
+"""
+
+REMOVE_RECIPE_SQL = """
+    UPDATE {items} item SET
+        total_amount = GREATEST(item.total_amount - ir.amount, 0),
+        recipe_count = GREATEST(item.recipe_count - 1, 0)
+    FROM {carts} cart
+    JOIN {ingredients} ir ON ir.recipe_id = cart.recipe_id
+    WHERE cart.recipe_id = %s {user_filter}
+        AND item.user_id = cart.user_id
+        AND item.ingredient_id = ir.ingredient_id
+"""
+
+PRUNE_SQL = """
+    DELETE FROM {items}
+    WHERE recipe_count = 0 AND user_id IN (
+        SELECT cart.user_id FROM {carts} cart
+        WHERE cart.recipe_id = %s {user_filter}
+    )
+"""
+
+
+APPLY_INGREDIENT_CHANGES_SQL = """
+    UPDATE {items} item SET
+        total_amount = GREATEST(item.total_amount + delta.amount, 0),
+        recipe_count = GREATEST(item.recipe_count + delta.recipes, 0)
+    FROM {carts} cart,
+        unnest(%s::bigint[], %s::integer[], %s::integer[])
+        AS delta(ingredient_id, amount, recipes)
+    WHERE cart.recipe_id = %s {user_filter}
+        AND item.user_id = cart.user_id
+        AND item.ingredient_id = delta.ingredient_id
+"""
+
+INSERT_ADDED_INGREDIENTS_SQL = """
+    INSERT INTO {items} (user_id, ingredient_id, total_amount, recipe_count)
+    SELECT cart.user_id, delta.ingredient_id, delta.amount, delta.recipes
+    FROM {carts} cart,
+        unnest(%s::bigint[], %s::integer[], %s::integer[])
+        AS delta(ingredient_id, amount, recipes)
+    WHERE cart.recipe_id = %s {user_filter} AND delta.recipes > 0
+    ON CONFLICT (user_id, ingredient_id) DO NOTHING
+"""
+
+ADD_RECIPES_FOR_USER_SQL = """
+    INSERT INTO {items} (user_id, ingredient_id, total_amount, recipe_count)
+    SELECT %s, ir.ingredient_id, SUM(ir.amount), COUNT(*)
+    FROM {ingredients} ir
+    WHERE ir.recipe_id = ANY(%s)
+    GROUP BY ir.ingredient_id
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE SET
+        total_amount = {items}.total_amount + EXCLUDED.total_amount,
+        recipe_count = {items}.recipe_count + EXCLUDED.recipe_count
+"""
+
+REMOVE_RECIPES_FOR_USER_SQL = """
+    UPDATE {items} item SET
+        total_amount = GREATEST(item.total_amount - delta.amount, 0),
+        recipe_count = GREATEST(item.recipe_count - delta.recipes, 0)
+    FROM (
+        SELECT ir.ingredient_id, SUM(ir.amount) AS amount,
+            COUNT(*) AS recipes
+        FROM {ingredients} ir
+        WHERE ir.recipe_id = ANY(%s)
+        GROUP BY ir.ingredient_id
+    ) delta
+    WHERE item.user_id = %s AND item.ingredient_id = delta.ingredient_id
+"""
+
+PRUNE_FOR_USER_SQL = """
+    DELETE FROM {items} WHERE user_id = %s AND recipe_count = 0
+"""
+
+CHANGE_MEDIA_REFERENCES_SQL = """
+    INSERT INTO {media} (name, reference_count, updated_at)
+    SELECT name, delta, NOW()
+    FROM unnest(%s::varchar[], %s::integer[]) AS changes(name, delta)
+    ON CONFLICT (name) DO UPDATE SET
+        reference_count = {media}.reference_count + EXCLUDED.reference_count,
+        updated_at = EXCLUDED.updated_at
+"""
+
+
+def _execute(statements, recipe, user=None, params=()):
+    tables = {
+        'items': ShoppingListItem._meta.db_table,
+        'carts': ShoppingCart._meta.db_table,
+        'ingredients': IngredientRecipe._meta.db_table,
+        'user_filter': '',
+    }
+    params = [*params, recipe.pk]
+    if user is not None:
+        tables['user_filter'] = 'AND cart.user_id = %s'
+        params.append(user.pk)
+
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(**tables), params)
+
+
+def add_recipe_to_shopping_lists(recipe, user=None):
+    """
+    Добавляет ингредиенты рецепта в списки покупок пользователей,
+    у которых он лежит в корзине. Вызывается после создания записи корзины.
+    """
+    _execute((ADD_RECIPE_SQL,), recipe, user)
+
+
+def remove_recipe_from_shopping_lists(recipe, user=None):
+    """
+    Вычитает ингредиенты рецепта из списков покупок.
+    Вызывается до удаления записи корзины или ингредиентов рецепта.
+    """
+    _execute((REMOVE_RECIPE_SQL, PRUNE_SQL), recipe, user)
+
+
+def apply_ingredient_changes_to_shopping_lists(recipe, added, changed,
+                                               removed):
+    """
+    Переносит изменения состава рецепта в списки покупок пользователей,
+    у которых он лежит в корзине, не пересчитывая остальные ингредиенты.
+    Статьи списка для новых ингредиентов вставляются вторым запросом,
+    поэтому уже обновлённые первым запросом строки не задваиваются.
+    """
+    deltas = [
+        *((pk, amount, 1) for pk, amount in added.items()),
+        *((pk, new - old, 0) for pk, (old, new) in changed.items()),
+        *((pk, -amount, -1) for pk, amount in removed.items()),
+    ]
+    if not deltas:
+        return
+    _execute(
+        (APPLY_INGREDIENT_CHANGES_SQL, INSERT_ADDED_INGREDIENTS_SQL),
+        recipe,
+        params=[list(column) for column in zip(*deltas)],
+    )
+    if removed:
+        _execute((PRUNE_SQL,), recipe)
+
+
+def get_ingredients_diff(old, new):
+    added = {pk: amount for pk, amount in new.items() if pk not in old}
+    changed = {
+        pk: (old[pk], amount) for pk, amount in new.items()
+        if pk in old and old[pk] != amount
+    }
+    removed = {pk: amount for pk, amount in old.items() if pk not in new}
+    return added, changed, removed
+
+
+def get_recipe_ingredients(recipe):
+    return dict(
+        IngredientRecipe.objects.filter(recipe=recipe)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def send_recipe_ingredients_changed(recipe, added, changed, removed,
+                                    created=False):
+    if added or changed or removed:
+        recipe_ingredients_changed.send(
+            sender=Recipe,
+            recipe=recipe,
+            added=added,
+            changed=changed,
+            removed=removed,
+            created=created,
+        )
+
+
+@transaction.atomic
+def set_recipe_ingredients(recipe, ingredients, created=False):
+    """
+    Приводит состав рецепта к {ingredient_id: amount} минимальным набором
+    запросов: удаляет лишние строки, обновляет изменившиеся количества и
+    вставляет новые. Затем отправляет recipe_ingredients_changed.
+    Для только что созданного рецепта текущий состав не читается.
+    """
+    rows = {}
+    if not created:
+        rows = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.select_for_update().filter(
+                recipe=recipe
+            )
+        }
+    old = {pk: row.amount for pk, row in rows.items()}
+    added, changed, removed = get_ingredients_diff(old, ingredients)
+
+    if removed:
+        IngredientRecipe.objects.filter(
+            pk__in=[rows[pk].pk for pk in removed]
+        ).delete()
+    if changed:
+        for pk, (_, amount) in changed.items():
+            rows[pk].amount = amount
+        IngredientRecipe.objects.bulk_update(
+            [rows[pk] for pk in changed], ['amount']
+        )
+    if added:
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in added.items()
+        )
+    send_recipe_ingredients_changed(recipe, added, changed, removed,
+                                    created)
+
+
+def _execute_for_user(statements):
+    tables = {
+        'items': ShoppingListItem._meta.db_table,
+        'ingredients': IngredientRecipe._meta.db_table,
+    }
+    with connection.cursor() as cursor:
+        for statement, params in statements:
+            cursor.execute(statement.format(**tables), params)
+
+
+def add_recipes_to_shopping_list(user, recipe_ids):
+    """Добавляет в список покупок пользователя сразу несколько рецептов."""
+    if recipe_ids:
+        _execute_for_user((
+            (ADD_RECIPES_FOR_USER_SQL, [user.pk, list(recipe_ids)]),
+        ))
+
+
+def remove_recipes_from_shopping_list(user, recipe_ids):
+    """Вычитает из списка покупок пользователя несколько рецептов."""
+    if recipe_ids:
+        _execute_for_user((
+            (REMOVE_RECIPES_FOR_USER_SQL, [list(recipe_ids), user.pk]),
+            (PRUNE_FOR_USER_SQL, [user.pk]),
+        ))
+
+
+def invalidate_user_relations(user_id):
+    """Сбрасывает кеши, зависящие от избранного и корзины пользователя."""
+    bump_versions(get_user_count_version(user_id))
+    invalidate_tags(user_relations_tag(user_id))
+
+
+def get_expected_shopping_list_items():
+    rows = (
+        IngredientRecipe.objects
+        .filter(recipe__shoppingcart_relations__isnull=False)
+        .values('recipe__shoppingcart_relations__user', 'ingredient')
+        .annotate(total_amount=Sum('amount'), recipe_count=Count('id'))
+        .order_by()
+    )
+    return {
+        (row['recipe__shoppingcart_relations__user'], row['ingredient']): (
+            row['total_amount'], row['recipe_count']
+        )
+        for row in rows
+    }
+
+
+def get_stored_shopping_list_items():
+    rows = ShoppingListItem.objects.values_list(
+        'user', 'ingredient', 'total_amount', 'recipe_count'
+    )
+    return {
+        (user, ingredient): (total_amount, recipe_count)
+        for user, ingredient, total_amount, recipe_count in rows
+    }
+
+
+def rebuild_shopping_lists(expected=None):
+    if expected is None:
+        expected = get_expected_shopping_list_items()
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total_amount,
+                recipe_count=recipe_count,
+            )
+            for (user_id, ingredient_id), (total_amount, recipe_count)
+            in expected.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def update_recipe_search_vectors(recipe_ids):
+    ingredient_names = (
+        IngredientRecipe.objects
+        .filter(recipe=OuterRef('pk'))
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(ingredient_names), weight='B',
+                           config=SEARCH_CONFIG)
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        )
+    )
+
+
+def get_media_fields():
+    """Поля с картинками и их вариантами, на которые считаются ссылки."""
+    return (
+        (Recipe, 'image', 'image_renditions'),
+        (get_user_model(), 'avatar', 'avatar_renditions'),
+    )
+
+
+def get_media_names(name, renditions):
+    names = [name] if name else []
+    for variants in (renditions or {}).get('variants', {}).values():
+        names.extend(variant_name for variant_name, _ in variants)
+    return names
+
+
+def get_media_changes(old_names, new_names):
+    changes = Counter(new_names)
+    changes.subtract(old_names)
+    return changes
+
+
+def change_media_references(changes):
+    """
+    Применяет изменения счётчиков ссылок вида {имя файла: дельта}.
+    Строки для новых файлов создаются на лету.
+    """
+    changes = {name: delta for name, delta in changes.items() if delta}
+    if not changes:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CHANGE_MEDIA_REFERENCES_SQL.format(
+                media=MediaFile._meta.db_table
+            ),
+            [list(changes.keys()), list(changes.values())],
+        )
+
+
+def get_expected_media_references():
+    references = Counter()
+    for model, field_name, renditions_field in get_media_fields():
+        rows = model.objects.values_list(field_name, renditions_field)
+        for name, renditions in rows.iterator():
+            references.update(get_media_names(name, renditions))
+    return references
+
+
+def rebuild_media_references():
+    """Пересчитывает счётчики ссылок по текущим данным в базе."""
+    expected = get_expected_media_references()
+    stored = dict(MediaFile.objects.values_list('name', 'reference_count'))
+    change_media_references({
+        name: expected.get(name, 0) - stored.get(name, 0)
+        for name in expected.keys() | stored.keys()
+    })
+
+
+def get_counters():
+    """
+    Денормализованные счётчики в виде (модель связи, поле связи,
+    модель со счётчиком, поле счётчика).
+    """
+    User = get_user_model()
+    return (
+        (Favorite, 'recipe', Recipe, 'favorites_count'),
+        (ShoppingCart, 'recipe', Recipe, 'shopping_carts_count'),
+        (Recipe, 'author', User, 'recipes_count'),
+        (Subscription, 'author', User, 'subscribers_count'),
+        (Subscription, 'follower', User, 'subscriptions_count'),
+    )
+
+
+def get_counter_field(relation_model, model):
+    for counter in get_counters():
+        if counter[0] is relation_model and counter[2] is model:
+            return counter[3]
+    raise LookupError(f'Нет счётчика {relation_model.__name__} '
+                      f'для {model.__name__}')
+
+
+def change_counters(model, field, changes):
+    """
+    Применяет {pk: приращение} к счётчику через F(): по одному UPDATE
+    на каждое различное приращение.
+    """
+    pks_by_delta = defaultdict(list)
+    for pk, delta in changes.items():
+        if delta:
+            pks_by_delta[delta].append(pk)
+    for delta, pks in pks_by_delta.items():
+        model.objects.filter(pk__in=pks).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+
+
+def get_expected_counter(relation_model, relation_field):
+    return Coalesce(
+        Subquery(
+            relation_model.objects
+            .filter(**{relation_field: OuterRef('pk')})
+            .order_by()
+            .values(relation_field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def get_drifted_counters():
+    """Возвращает {(модель, поле): число строк с неверным счётчиком}."""
+    drifted = {}
+    for relation_model, relation_field, model, field in get_counters():
+        count = (
+            model.objects
+            .annotate(expected=get_expected_counter(relation_model,
+                                                    relation_field))
+            .exclude(**{field: F('expected')})
+            .count()
+        )
+        if count:
+            drifted[model, field] = count
+    return drifted
+
+
+def reconcile_counters():
+    """Пересчитывает все счётчики, у которых значение разошлось с данными."""
+    for relation_model, relation_field, model, field in get_counters():
+        expected = get_expected_counter(relation_model, relation_field)
+        model.objects.annotate(expected=expected).exclude(
+            **{field: F('expected')}
+        ).update(**{field: expected})
@@ -0,0 +1,175 @@
+import csv
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.utils.timezone import now
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .models import Recipe, ShoppingListItem
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_shopping_list_ingredients(user):
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'total_amount',
+        )
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+    )
+
+
+def get_shopping_list_recipes(user):
+    return (
+        Recipe.objects
+        .filter(shoppingcart_relations__user=user)
+        .select_related('author')
+        .only('name', 'author__first_name', 'author__last_name')
+        .order_by('name')
+    )
+
+
+class ShoppingList:
+    """Ленивое представление списка покупок пользователя."""
+
+    def __init__(self, user):
+        self.user = user
+        self.date = now().strftime('%d.%m.%Y')
+
+    @property
+    def title(self):
+        return f'Список покупок (сформирован {self.date})'
+
+    def ingredients(self):
+        items = get_shopping_list_ingredients(self.user).iterator()
+        for item in items:
+            yield (
+                item['ingredient__name'].capitalize(),
+                item['ingredient__measurement_unit'],
+                item['total_amount'],
+            )
+
+    def recipes(self):
+        for recipe in get_shopping_list_recipes(self.user).iterator():
+            yield recipe.name, recipe.author.get_full_name()
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер, отдающий список покупок по частям."""
+
+    charset = 'utf-8'
+
+    def iter_render(self, shopping_list):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, ShoppingList):
+            return JSONRenderer().render(data)
+        return b''.join(self.iter_render(data))
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def iter_render(self, shopping_list):
+        yield f'{shopping_list.title}:\n\n'.encode()
+        for idx, (name, unit, amount) in enumerate(
+            shopping_list.ingredients(), 1
+        ):
+            yield f'{idx}. {name} ({unit}): {amount}\n'.encode()
+
+        yield '\nРецепты:\n'.encode()
+        for name, author in shopping_list.recipes():
+            yield f'- {name} — {author}\n'.encode()
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def iter_render(self, shopping_list):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Единица измерения', 'Количество')
+        ).encode()
+        for row in shopping_list.ingredients():
+            yield writer.writerow(row).encode()
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """
+    PDF собирается постранично во временный файл, который уходит на диск
+    при превышении CHUNK_SIZE, и отдаётся кусками.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    font_size = 12
+    line_height = 18
+    margin = 2 * cm
+
+    def get_font_name(self):
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if not os.path.exists(font_path):
+            return 'Helvetica'
+        font_name = os.path.splitext(os.path.basename(font_path))[0]
+        if font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(font_name, font_path))
+        return font_name
+
+    def iter_lines(self, shopping_list):
+        yield shopping_list.title
+        yield ''
+        for idx, (name, unit, amount) in enumerate(
+            shopping_list.ingredients(), 1
+        ):
+            yield f'{idx}. {name} ({unit}): {amount}'
+        yield ''
+        yield 'Рецепты:'
+        for name, author in shopping_list.recipes():
+            yield f'- {name} — {author}'
+
+    def iter_render(self, shopping_list):
+        font_name = self.get_font_name()
+        width, height = A4
+        with SpooledTemporaryFile(max_size=CHUNK_SIZE) as buffer:
+            document = canvas.Canvas(buffer, pagesize=A4)
+            document.setFont(font_name, self.font_size)
+            y = height - self.margin
+            for line in self.iter_lines(shopping_list):
+                if y < self.margin:
+                    document.showPage()
+                    document.setFont(font_name, self.font_size)
+                    y = height - self.margin
+                document.drawString(self.margin, y, line)
+                y -= self.line_height
+            document.save()
+
+            buffer.seek(0)
+            while chunk := buffer.read(CHUNK_SIZE):
+                yield chunk
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+)
@@ -0,0 +1,240 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from users.models import Subscription
+
+from .autocomplete import invalidate_ingredient_index
+from .cache import (
+    RANKING_TAG,
+    RECIPES_LIST_TAG,
+    RECIPES_SEARCH_TAG,
+    RECIPES_TAG,
+    USERS_TAG,
+    author_recipes_tag,
+    bump_versions,
+    invalidate_tags,
+    recipe_tag,
+    user_relations_tag,
+    user_tag,
+)
+from .images import schedule_renditions
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+)
+from .pagination import RECIPES_COUNT_VERSION
+from .ranking import remove_ranking_event
+from .services import (
+    apply_ingredient_changes_to_shopping_lists,
+    change_counters,
+    change_media_references,
+    get_counters,
+    get_media_changes,
+    get_media_fields,
+    get_media_names,
+    invalidate_user_relations,
+    recipe_ingredients_changed,
+    remove_recipe_from_shopping_lists,
+    update_recipe_search_vectors,
+)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe_from_shopping_lists(sender, instance, **kwargs):
+    remove_recipe_from_shopping_lists(instance)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reset_ingredient_index(sender, **kwargs):
+    invalidate_ingredient_index()
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_recipes_search(sender, instance, created, **kwargs):
+    if not created:
+        update_recipe_search_vectors(
+            instance.ingredient_recipes.values('recipe')
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_search(sender, instance, **kwargs):
+    update_recipe_search_vectors([instance.pk])
+
+
+@receiver(recipe_ingredients_changed)
+def apply_ingredient_changes(sender, recipe, added, changed, removed,
+                             created=False, **kwargs):
+    if not created:
+        apply_ingredient_changes_to_shopping_lists(recipe, added, changed,
+                                                   removed)
+    if added or removed:
+        update_recipe_search_vectors([recipe.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    schedule_renditions(instance, 'image', 'image_renditions',
+                        [recipe_tag(instance.pk), RECIPES_TAG])
+
+
+@receiver(post_save, sender=get_user_model())
+def process_user_avatar(sender, instance, **kwargs):
+    schedule_renditions(instance, 'avatar', 'avatar_renditions',
+                        [user_tag(instance.pk), USERS_TAG])
+
+
+MEDIA_FIELDS = {
+    model: (field_name, renditions_field)
+    for model, field_name, renditions_field in get_media_fields()
+}
+
+
+def _get_instance_media_names(instance):
+    field_name, renditions_field = MEDIA_FIELDS[type(instance)]
+    return get_media_names(getattr(instance, field_name).name,
+                           getattr(instance, renditions_field))
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=get_user_model())
+def remember_media_names(sender, instance, update_fields=None, **kwargs):
+    fields = MEDIA_FIELDS[sender]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    old = None
+    if instance.pk:
+        old = sender.objects.filter(pk=instance.pk).values_list(
+            *fields
+        ).first()
+    instance._old_media_names = get_media_names(*old) if old else []
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=get_user_model())
+def update_media_references(sender, instance, **kwargs):
+    old_names = instance.__dict__.pop('_old_media_names', None)
+    if old_names is not None:
+        change_media_references(get_media_changes(
+            old_names, _get_instance_media_names(instance)
+        ))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=get_user_model())
+def release_media_references(sender, instance, **kwargs):
+    change_media_references(get_media_changes(
+        _get_instance_media_names(instance), []
+    ))
+
+
+COUNTERS = defaultdict(list)
+for relation_model, relation_field, model, field in get_counters():
+    COUNTERS[relation_model].append((relation_field, model, field))
+
+
+def _change_instance_counters(instance, delta):
+    for relation_field, model, field in COUNTERS[type(instance)]:
+        pk = getattr(instance, f'{relation_field}_id')
+        change_counters(model, field, {pk: delta})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increment_counters(sender, instance, created, **kwargs):
+    if created:
+        _change_instance_counters(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrement_counters(sender, instance, **kwargs):
+    _change_instance_counters(instance, -1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def remove_recipe_ranking_event(sender, instance, **kwargs):
+    if remove_ranking_event(instance):
+        invalidate_tags(RANKING_TAG)
+
+
+@receiver(post_save, sender=Recipe)
+def reset_recipe_counts_on_create(sender, created, **kwargs):
+    if created:
+        bump_versions(RECIPES_COUNT_VERSION)
+
+
+@receiver(post_delete, sender=Recipe)
+def reset_recipe_counts_on_delete(sender, **kwargs):
+    bump_versions(RECIPES_COUNT_VERSION)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def reset_user_recipe_counts(sender, instance, **kwargs):
+    invalidate_user_relations(instance.user_id)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_user_subscriptions(sender, instance, **kwargs):
+    invalidate_tags(user_relations_tag(instance.follower_id))
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_saved_recipe(sender, instance, created, **kwargs):
+    tags = [recipe_tag(instance.pk), RECIPES_TAG, RECIPES_SEARCH_TAG]
+    if created:
+        tags += [RECIPES_LIST_TAG, author_recipes_tag(instance.author_id)]
+    invalidate_tags(*tags)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    invalidate_tags(recipe_tag(instance.pk), RECIPES_TAG, RECIPES_LIST_TAG,
+                    RECIPES_SEARCH_TAG, author_recipes_tag(instance.author_id))
+
+
+@receiver(recipe_ingredients_changed)
+def invalidate_recipe_ingredients(sender, recipe, added, removed, **kwargs):
+    tags = [recipe_tag(recipe.pk), RECIPES_TAG]
+    if added or removed:
+        tags.append(RECIPES_SEARCH_TAG)
+    invalidate_tags(*tags)
+
+
+@receiver(post_save, sender=Ingredient)
+def invalidate_ingredient_recipes(sender, instance, created, **kwargs):
+    if created:
+        return
+    recipe_ids = instance.ingredient_recipes.values_list('recipe_id',
+                                                          flat=True)
+    invalidate_tags(RECIPES_TAG, RECIPES_SEARCH_TAG,
+                    *(recipe_tag(recipe_id) for recipe_id in recipe_ids))
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    # Время входа в ответы API не попадает, а update_last_login
+    # сохраняет пользователя при каждой выдаче токена.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_tags(user_tag(instance.pk), USERS_TAG)
@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Max, Q
+from scipy import sparse
+
+from .cache import RECIPES_TAG, get_version
+from .models import IngredientRecipe, Recipe
+
+INDEX_VERSION = RECIPES_TAG
+DEFAULT_LIMIT = 6
+MAX_LIMIT = 50
+# Рецепты, сохранённые незадолго до прошлого обновления, перечитываются
+# повторно: транзакция могла зафиксироваться позже своего updated_at.
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+
+class RecipeVectors:
+    """
+    Рецепты в виде строк разреженной матрицы CSR (рецепт × ингредиент),
+    где столбец — id ингредиента, а значение — 1.
+
+    Изменённый рецепт дописывается новой строкой, а старая строка
+    помечается неактивной; когда неактивных строк становится больше
+    половины, матрица уплотняется. Оценки для всех рецептов считаются
+    одним умножением матрицы на вектор.
+    """
+
+    def __init__(self):
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.recipe_ids = np.empty(0, dtype=np.int64)
+        self.active = np.empty(0, dtype=bool)
+        self.sizes = np.empty(0, dtype=np.float32)
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def update(self, recipes):
+        """Добавляет или заменяет рецепты: {recipe_id: [ingredient_id]}."""
+        if not recipes:
+            return
+        self.remove(recipes)
+
+        recipe_ids = list(recipes)
+        ingredients = [sorted(set(recipes[pk])) for pk in recipe_ids]
+        indptr = np.cumsum([0] + [len(row) for row in ingredients])
+        indices = np.fromiter(
+            (column for row in ingredients for column in row),
+            dtype=np.int32,
+            count=indptr[-1],
+        )
+        width = max(self.matrix.shape[1],
+                    int(indices.max()) + 1 if len(indices) else 0)
+        block = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(len(recipe_ids), width),
+        )
+        self.matrix.resize((self.matrix.shape[0], width))
+
+        start = len(self.recipe_ids)
+        self.matrix = sparse.vstack([self.matrix, block], format='csr')
+        self.recipe_ids = np.concatenate([self.recipe_ids, recipe_ids])
+        self.active = np.concatenate(
+            [self.active, np.ones(len(recipe_ids), dtype=bool)]
+        )
+        self.rows.update(
+            (pk, start + offset) for offset, pk in enumerate(recipe_ids)
+        )
+        self.sizes = np.diff(self.matrix.indptr).astype(np.float32)
+
+        if len(self.rows) * 2 < len(self.recipe_ids):
+            self.compact()
+
+    def remove(self, recipe_ids):
+        for pk in recipe_ids:
+            row = self.rows.pop(pk, None)
+            if row is not None:
+                self.active[row] = False
+
+    def compact(self):
+        keep = np.flatnonzero(self.active)
+        self.matrix = self.matrix[keep]
+        self.recipe_ids = self.recipe_ids[keep]
+        self.active = np.ones(len(keep), dtype=bool)
+        self.sizes = self.sizes[keep]
+        self.rows = {int(pk): row for row, pk in enumerate(self.recipe_ids)}
+
+    def get_vector(self, ingredient_ids):
+        columns = sorted({
+            pk for pk in ingredient_ids if 0 <= pk < self.matrix.shape[1]
+        })
+        return sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), columns,
+             [0, len(columns)]),
+            shape=(1, self.matrix.shape[1]),
+        )
+
+    def get_intersections(self, vector):
+        return (self.matrix @ vector.T).toarray().ravel()
+
+    def top(self, scores, limit, exclude=None):
+        """Возвращает [(recipe_id, оценка)] по убыванию оценки и id."""
+        scores = np.where(self.active, scores, 0)
+        if exclude is not None:
+            scores[exclude] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[
+                np.argpartition(-scores[candidates], limit - 1)[:limit]
+            ]
+        order = np.lexsort((-self.recipe_ids[candidates],
+                            -scores[candidates]))
+        return [
+            (int(self.recipe_ids[row]), float(scores[row]))
+            for row in candidates[order]
+        ]
+
+    def similar(self, recipe_id, limit=DEFAULT_LIMIT):
+        """Рецепты, ближайшие к данному по коэффициенту Жаккара."""
+        row = self.rows.get(recipe_id)
+        if row is None:
+            return []
+        intersections = self.get_intersections(self.matrix[row])
+        unions = self.sizes + self.sizes[row] - intersections
+        scores = intersections / np.maximum(unions, 1)
+        return self.top(scores, limit, exclude=row)
+
+    def cookable(self, ingredient_ids, limit=DEFAULT_LIMIT):
+        """
+        Рецепты, для которых есть наибольшая доля ингредиентов из
+        ingredient_ids.
+        """
+        intersections = self.get_intersections(
+            self.get_vector(ingredient_ids)
+        )
+        scores = intersections / np.maximum(self.sizes, 1)
+        return self.top(scores, limit)
+
+
+def refresh_recipe_vectors(vectors, since=None):
+    """
+    Загружает в матрицу рецепты, изменённые начиная с since (все, если
+    since не задан), а также отсутствующие в ней, и убирает удалённые.
+    Возвращает отметку времени для следующего обновления.
+    """
+    recipes = Recipe.objects.all()
+    if since is not None:
+        # Наборы id сравниваются целиком: совпадение одного лишь числа
+        # рецептов не означает, что удалённые рецепты уже убраны.
+        existing = set(Recipe.objects.values_list('id', flat=True).iterator())
+        vectors.remove(set(vectors.rows) - existing)
+        recipes = recipes.filter(
+            Q(updated_at__gte=since - REFRESH_OVERLAP)
+            | Q(pk__in=existing - set(vectors.rows))
+        )
+
+    watermark = recipes.aggregate(watermark=Max('updated_at'))['watermark']
+    changed = {
+        pk: [] for pk in recipes.values_list('id', flat=True).iterator()
+    }
+    rows = (
+        IngredientRecipe.objects
+        .filter(recipe__in=recipes.values('id'))
+        .values_list('recipe_id', 'ingredient_id')
+        .order_by()
+    )
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id in rows.iterator():
+        ingredients[recipe_id].append(ingredient_id)
+    for pk in changed:
+        changed[pk] = ingredients[pk]
+    vectors.update(changed)
+    return watermark or since
+
+
+_vectors = None
+_version = None
+_watermark = None
+
+
+def get_recipe_vectors():
+    """
+    Возвращает матрицу рецептов процесса. После изменения рецептов
+    матрица не строится заново, а дополняется изменёнными рецептами.
+    """
+    global _vectors, _version, _watermark
+
+    version = get_version(INDEX_VERSION)
+    if _vectors is None:
+        _vectors = RecipeVectors()
+        _watermark = refresh_recipe_vectors(_vectors)
+        _version = version
+    elif _version != version:
+        _watermark = refresh_recipe_vectors(_vectors, _watermark)
+        _version = version
+    return _vectors
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+
+from food.models import Ingredient, IngredientRecipe, Recipe
+
+PASSWORD = 'Pa55word!x'
+
+
+def create_user(username):
+    return get_user_model().objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password=PASSWORD, first_name='Имя', last_name='Фамилия',
+    )
+
+
+def create_ingredients(count):
+    return Ingredient.objects.bulk_create([
+        Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+        for index in range(count)
+    ])
+
+
+def create_recipe(author, name='Рецепт', ingredients=(), amount=10):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Описание', cooking_time=10,
+        image='recipes/image.png',
+    )
+    IngredientRecipe.objects.bulk_create([
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient in ingredients
+    ])
+    return recipe
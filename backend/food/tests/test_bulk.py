@@ -0,0 +1,48 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from food.models import Ingredient, Recipe, ShoppingCart, ShoppingListItem
+from food.tests.factories import create_recipe, create_user
+
+
+class BulkShoppingCartTest(TestCase):
+    """Массовое добавление учитывает только действительно вставленные связи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        ingredient = Ingredient.objects.create(name='Мука',
+                                               measurement_unit='г')
+        cls.recipes = [
+            create_recipe(cls.user, f'Рецепт {index}', [ingredient], 100)
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_add(self):
+        first, second = self.recipes
+        self.client.post(f'/api/recipes/{first.pk}/shopping_cart/')
+
+        response = self.client.post(
+            '/api/recipes/shopping_cart/',
+            {'recipes': [first.pk, second.pk, 999999]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['status'] for item in response.json()],
+            ['already_added', 'added', 'not_found'],
+        )
+        self.assertEqual(
+            list(Recipe.objects.order_by('pk')
+                 .values_list('shopping_carts_count', flat=True)),
+            [1, 1],
+        )
+        self.assertEqual(ShoppingCart.objects.filter(user=self.user).count(),
+                         2)
+        item = ShoppingListItem.objects.get(user=self.user)
+        self.assertEqual((item.total_amount, item.recipe_count), (200, 2))
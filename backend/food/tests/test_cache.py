@@ -0,0 +1,161 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from food import catalog
+from food.cache import (
+    INGREDIENTS_TAG,
+    USERS_TAG,
+    bump_versions,
+    get_cached_data,
+    get_generation,
+    get_version,
+    get_versions,
+    set_cached_data,
+    user_tag,
+)
+from food.models import Ingredient
+from food.tests.factories import PASSWORD, create_recipe, create_user
+
+
+class UserInvalidationTest(TestCase):
+    """Сохранение пользователя сбрасывает только нужные версии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.other = create_user('other')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_login_keeps_versions(self):
+        tags = (user_tag(self.user.pk), USERS_TAG)
+        versions = get_versions(*tags)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/login/', {
+                'email': self.user.email, 'password': PASSWORD,
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_versions(*tags), versions)
+
+    def test_profile_etag_ignores_other_users(self):
+        url = f'/api/users/{self.user.pk}/'
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.first_name = 'Другое'
+            self.other.save()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Другое'
+            self.user.save()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+
+class CachedDataTest(TestCase):
+    """Запись не сохраняется, если тег сброшен после чтения данных."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bumped_after_read_is_not_stored(self):
+        generation = get_generation()
+        bump_versions('recipe:1')
+
+        set_cached_data('key', 'stale', ['recipe:1'], 60, generation)
+
+        self.assertIsNone(get_cached_data('key'))
+
+    def test_unchanged_tags_are_stored(self):
+        get_versions('recipe:1')
+        generation = get_generation()
+        bump_versions('recipe:2')
+
+        set_cached_data('key', 'fresh', ['recipe:1'], 60, generation)
+
+        self.assertEqual(get_cached_data('key'), 'fresh')
+
+    def test_generation_survives_eviction(self):
+        bump_versions('recipe:1')
+        generation = get_generation()
+        cache.delete('versions:generation')
+
+        self.assertGreater(get_generation(), generation)
+
+
+class RecipeConditionalGetTest(TestCase):
+    """Рецепт отдаётся заново, если изменился автор."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_if_modified_since_is_ignored(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.assertNotIn('Last-Modified', self.client.get(url))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Другое'
+            self.author.save()
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['author']['first_name'], 'Другое')
+
+
+class RecipeFragmentTest(TestCase):
+    """Фрагменты рецептов не смешиваются между схемами запроса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        create_recipe(cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_image_url_keeps_scheme(self):
+        for secure, scheme in ((False, 'http'), (True, 'https')):
+            with self.subTest(scheme=scheme):
+                response = self.client.get('/api/recipes/', secure=secure)
+                image = response.json()['results'][0]['image']
+                self.assertTrue(image.startswith(f'{scheme}://'), image)
+
+
+class IngredientCatalogTest(TestCase):
+    """В кеше хранится только последний снимок справочника."""
+
+    def setUp(self):
+        cache.clear()
+        catalog._catalog = None
+
+    def test_snapshot_is_replaced(self):
+        Ingredient.objects.create(name='Мука', measurement_unit='г')
+        first = catalog.get_ingredient_catalog()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Соль', measurement_unit='г')
+        second = catalog.get_ingredient_catalog()
+
+        self.assertNotEqual(first.digest, second.digest)
+        version, cached = cache.get(catalog.CATALOG_KEY)
+        self.assertEqual(version, get_version(INGREDIENTS_TAG))
+        self.assertEqual(cached.digest, second.digest)
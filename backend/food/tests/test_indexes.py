@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from django.db import connection
+from django.test import TestCase
+
+from food.filters import RecipeFilter
+from food.models import Favorite, IngredientRecipe, Recipe, ShoppingCart
+from food.tests.factories import create_user
+from users.models import Subscription
+
+
+class HotPathIndexTest(TestCase):
+    """Индексы горячих запросов созданы и используются планировщиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+
+    def get_index_names(self, model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table
+            )
+        return {
+            name for name, constraint in constraints.items()
+            if constraint['index']
+        }
+
+    def test_indexes_exist(self):
+        expected = {
+            Recipe: {'recipe_created_at_idx', 'recipe_author_created_at_idx'},
+            IngredientRecipe: {'ingredient_recipe_recipe_idx'},
+            Favorite: {'favorite_recipe_user_idx'},
+            ShoppingCart: {'shoppingcart_recipe_user_idx'},
+            Subscription: {'subscription_author_idx'},
+        }
+        for model, names in expected.items():
+            with self.subTest(model=model.__name__):
+                self.assertLessEqual(names, self.get_index_names(model))
+
+    def explain(self, queryset):
+        # На пустой таблице планировщик предпочтёт последовательное
+        # чтение, поэтому оно запрещается до конца транзакции теста.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_author_filter_uses_index(self):
+        plan = self.explain(
+            Recipe.objects.filter(author=self.author)
+            .order_by('-created_at')[:10]
+        )
+        self.assertIn('recipe_author_created_at_idx', plan)
+
+    def test_list_ordering_uses_index(self):
+        plan = self.explain(Recipe.objects.order_by('-created_at', '-id')[:10])
+        self.assertIn('recipe_created_at_idx', plan)
+
+    def test_favorites_filter_uses_index(self):
+        recipes = RecipeFilter(
+            data={'is_favorited': '1'},
+            queryset=Recipe.objects.all(),
+            request=SimpleNamespace(user=self.author),
+        ).qs
+        plan = self.explain(recipes[:10])
+        # Избранное пользователя читается по уникальному индексу
+        # (user, recipe), рецепты — по первичному ключу.
+        self.assertIn('unique_favorite', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_relation_flags_use_index(self):
+        plan = self.explain(
+            Recipe.objects.for_user(self.author).filter(pk=1)
+        )
+        self.assertIn('favorite_recipe_user_idx', plan)
+        self.assertIn('shoppingcart_recipe_user_idx', plan)
@@ -0,0 +1,64 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from food.models import MediaFile
+from food.services import get_media_names
+from food.tests.factories import create_user
+
+IMAGE = (
+    'data:image/png;base64,'
+    'iVBORw0KGgoAAAANSUhEUgAAACgAAAAeCAIAAADRv8uKAAAALElEQVR4nO3NMQEAAAQA'
+    'MJz6hxJLBZ9nK7Cc7vhQL6tYLBaLxWKxWCwWi08W5uMBGPa2QY4AAAAASUVORK5CYII='
+)
+
+
+class MediaReferencesTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root,
+                                     IMAGE_RENDITION_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.users = [create_user(f'user{index}') for index in range(2)]
+        self.clients = []
+        for user in self.users:
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients.append(client)
+
+    def get_avatar_names(self, user):
+        user.refresh_from_db()
+        return get_media_names(user.avatar.name, user.avatar_renditions)
+
+    def test_shared_avatar_survives_other_user_removing_avatar(self):
+        for client in self.clients:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.put('/api/users/me/avatar/',
+                                      {'avatar': IMAGE}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        first, second = self.users
+        names = self.get_avatar_names(second)
+        self.assertGreater(len(names), 1)
+        self.assertEqual(self.get_avatar_names(first), names)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.clients[0].delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, 204)
+        call_command('collect_media_garbage', '--grace', '0',
+                     stdout=StringIO())
+
+        self.assertEqual(self.get_avatar_names(second), names)
+        for name in names:
+            self.assertTrue(default_storage.exists(name), name)
+            self.assertEqual(
+                MediaFile.objects.get(name=name).reference_count, 1
+            )
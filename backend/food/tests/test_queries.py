@@ -0,0 +1,107 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from food import autocomplete, similarity
+from food.models import Favorite, IngredientRecipe, ShoppingCart
+from food.tests.factories import (
+    create_ingredients,
+    create_recipe,
+    create_user,
+)
+from users.models import Subscription
+
+PAGE_SIZES = (1, 20)
+
+
+class QueryBudgetTest(TestCase):
+    """Число запросов к базе фиксировано и не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.authors = [create_user(f'author{index}') for index in range(20)]
+        cls.ingredients = create_ingredients(20)
+        cls.recipes = [
+            create_recipe(cls.authors[index % len(cls.authors)],
+                          f'Рецепт {index}', cls.ingredients[:3])
+            for index in range(40)
+        ]
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.authors:
+            Subscription.objects.create(follower=cls.user, author=author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertQueryBudget(self, url, budget, expected_results=None):
+        # Кеши и индексы процесса сбрасываются, поэтому бюджет учитывает
+        # и их построение.
+        cache.clear()
+        similarity._vectors = None
+        autocomplete._index = None
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if expected_results is not None:
+            data = response.json()
+            if isinstance(data, dict):
+                data = data['results']
+            self.assertEqual(len(data), expected_results)
+
+    def assertPageBudget(self, url_template, budget):
+        for limit in PAGE_SIZES:
+            with self.subTest(limit=limit):
+                self.assertQueryBudget(url_template.format(limit=limit),
+                                       budget, limit)
+
+    def test_recipe_list(self):
+        self.assertPageBudget('/api/recipes/?limit={limit}', 6)
+
+    def test_recipe_list_with_cursor(self):
+        self.assertPageBudget('/api/recipes/?limit={limit}&cursor=', 4)
+
+    def test_subscriptions(self):
+        self.assertPageBudget(
+            '/api/users/subscriptions/?limit={limit}&recipes_limit=3', 3
+        )
+
+    def test_feed(self):
+        self.assertPageBudget('/api/recipes/feed/?limit={limit}', 6)
+
+    def test_similar(self):
+        self.assertPageBudget(
+            f'/api/recipes/{self.recipes[0].pk}/similar/?limit={{limit}}', 8
+        )
+
+    def test_cookable(self):
+        have = ','.join(str(ingredient.pk)
+                        for ingredient in self.ingredients[:3])
+        self.assertPageBudget(
+            f'/api/recipes/cookable/?have={have}&limit={{limit}}', 7
+        )
+
+    def test_ingredients(self):
+        self.assertQueryBudget('/api/ingredients/?name=Ин', 1,
+                               len(self.ingredients))
+
+    def test_ingredient_autocomplete(self):
+        self.assertPageBudget(
+            '/api/ingredients/autocomplete/?name=Ин&limit={limit}', 1
+        )
+
+    def test_recipe_retrieve(self):
+        recipe = create_recipe(self.authors[0], 'Большой рецепт')
+        url = f'/api/recipes/{recipe.pk}/'
+        for ingredients in (self.ingredients[:1], self.ingredients):
+            IngredientRecipe.objects.filter(recipe=recipe).delete()
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=10)
+                for ingredient in ingredients
+            ])
+            with self.subTest(ingredients=len(ingredients)):
+                self.assertQueryBudget(url, 3)
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from food.models import Favorite, RankingCheckpoint, Recipe
+from food.ranking import update_rankings
+from food.tests.factories import create_recipe, create_user
+
+
+class PopularityScoreTest(TestCase):
+    """Популярность пересчитывается только у рецептов с новыми связями."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.old = create_recipe(cls.user, 'Старый')
+        cls.new = create_recipe(cls.user, 'Новый')
+
+    def test_only_recipes_with_new_events_are_updated(self):
+        checkpoint = timezone.now() - timedelta(hours=1)
+        RankingCheckpoint.objects.update(epoch=checkpoint,
+                                         processed_until=checkpoint)
+        Favorite.objects.create(user=self.user, recipe=self.new)
+        Favorite.objects.update(created_at=checkpoint + timedelta(minutes=1))
+        Recipe.objects.filter(pk=self.old.pk).update(favorites_count=5)
+
+        trending, popular = update_rankings()
+
+        self.assertEqual(popular, 1)
+        scores = dict(Recipe.objects.values_list('pk', 'popularity_score'))
+        self.assertEqual(scores[self.new.pk], 2)
+        self.assertEqual(scores[self.old.pk], 0)
+        self.assertGreater(
+            RankingCheckpoint.objects.get().processed_until, checkpoint
+        )
+
+    def test_rebuild_updates_all_recipes(self):
+        Recipe.objects.filter(pk=self.old.pk).update(favorites_count=5)
+
+        update_rankings(rebuild=True)
+
+        self.assertEqual(
+            Recipe.objects.get(pk=self.old.pk).popularity_score, 10
+        )
+
+    def test_removed_relation_is_subtracted(self):
+        favorite = Favorite.objects.create(user=self.user, recipe=self.new)
+        Favorite.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        update_rankings(rebuild=True)
+        recipe = Recipe.objects.get(pk=self.new.pk)
+        self.assertEqual(recipe.popularity_score, 2)
+        self.assertGreater(recipe.trending_score, 0)
+
+        favorite.refresh_from_db()
+        favorite.delete()
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.popularity_score, 0)
+        self.assertAlmostEqual(recipe.trending_score, 0)
+        self.assertEqual(update_rankings(), (0, 0))
+
+    def test_unprocessed_relation_is_not_subtracted(self):
+        Favorite.objects.create(user=self.user, recipe=self.old)
+        update_rankings(rebuild=True)
+        favorite = Favorite.objects.create(user=self.user, recipe=self.new)
+        Recipe.objects.filter(pk=self.new.pk).update(popularity_score=4)
+
+        favorite.delete()
+
+        self.assertEqual(
+            Recipe.objects.get(pk=self.new.pk).popularity_score, 4
+        )
@@ -0,0 +1,102 @@
+import base64
+import io
+import os
+import textwrap
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from food.serializers import Base64ImageField
+from food.tests.factories import create_recipe, create_user
+
+
+def make_png(size):
+    image = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+    """Декодирование картинок из data URI."""
+
+    def setUp(self):
+        # Картинка больше части, декодируемой за раз.
+        self.png = make_png(200)
+        self.payload = base64.b64encode(self.png).decode()
+
+    def decode(self, payload):
+        image = Base64ImageField().to_internal_value(
+            f'data:image/png;base64,{payload}'
+        )
+        self.addCleanup(image.close)
+        return image
+
+    def test_decode(self):
+        image = self.decode(self.payload)
+
+        self.assertEqual(image.name, 'temp.png')
+        self.assertEqual(image.read(), self.png)
+
+    def test_decode_wrapped_lines(self):
+        for separator in ('\n', '\r\n', ' '):
+            with self.subTest(separator=repr(separator)):
+                payload = separator.join(textwrap.wrap(self.payload, 76))
+
+                image = self.decode(payload)
+
+                self.assertEqual(image.size, len(self.png))
+                self.assertEqual(image.read(), self.png)
+
+    def test_invalid_characters(self):
+        with self.assertRaises(serializers.ValidationError):
+            self.decode(self.payload[:100] + '!' + self.payload[100:])
+
+    def test_truncated_payload(self):
+        with self.assertRaises(serializers.ValidationError):
+            self.decode(self.payload[:-1])
+
+    def test_oversized_payload(self):
+        with override_settings(MAX_IMAGE_UPLOAD_SIZE=len(self.png) // 2):
+            with self.assertRaises(serializers.ValidationError) as error:
+                self.decode(self.payload)
+        self.assertEqual(error.exception.detail[0].code, 'max_size')
+
+
+class SrcsetOptInTest(TestCase):
+    """Поля *_srcset отдаются только по запросу с ?srcset=1."""
+
+    user_fields = ['email', 'id', 'username', 'first_name', 'last_name',
+                   'is_subscribed', 'avatar']
+    recipe_fields = ['id', 'author', 'ingredients', 'is_favorited',
+                     'is_in_shopping_cart', 'name', 'image', 'text',
+                     'cooking_time']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('author')
+        create_recipe(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_default_fields_match_contract(self):
+        user = self.client.get('/api/users/').json()['results'][0]
+        recipe = self.client.get('/api/recipes/').json()['results'][0]
+
+        self.assertEqual(list(user), self.user_fields)
+        self.assertEqual(list(recipe), self.recipe_fields)
+        self.assertEqual(list(recipe['author']), self.user_fields)
+
+    def test_srcset_on_request(self):
+        user = self.client.get('/api/users/?srcset=1').json()['results'][0]
+        recipe = self.client.get('/api/recipes/?srcset=1').json()['results'][0]
+
+        self.assertEqual(user['avatar_srcset'], {})
+        self.assertEqual(recipe['image_srcset'], {})
+        self.assertIn('avatar_srcset', recipe['author'])
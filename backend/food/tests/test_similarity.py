@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food import similarity
+from food.models import Recipe
+from food.tests.factories import (
+    create_ingredients,
+    create_recipe,
+    create_user,
+)
+
+
+class CookableTest(TestCase):
+    """Подбор рецептов по имеющимся ингредиентам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.ingredients = create_ingredients(4)
+        cls.recipes = [
+            create_recipe(author, 'Полный', cls.ingredients[:2]),
+            create_recipe(author, 'Частичный', cls.ingredients[1:4]),
+        ]
+
+    def setUp(self):
+        cache.clear()
+        similarity._vectors = None
+        self.client = APIClient()
+
+    def test_cookable(self):
+        have = ','.join(str(ingredient.pk)
+                        for ingredient in self.ingredients[:2])
+        response = self.client.get(f'/api/recipes/cookable/?have={have}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe['id'] for recipe in response.json()],
+                         [recipe.pk for recipe in self.recipes])
+
+    def test_cookable_requires_ingredients(self):
+        response = self.client.get('/api/recipes/cookable/?have=x')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_deleted_recipe_is_not_returned(self):
+        deleted, kept = self.recipes
+        now = timezone.now()
+        Recipe.objects.filter(pk=kept.pk).update(
+            updated_at=now - timedelta(hours=2)
+        )
+        Recipe.objects.filter(pk=deleted.pk).update(
+            updated_at=now - timedelta(hours=1)
+        )
+        vectors = similarity.get_recipe_vectors()
+        # Рецепт, пропущенный прошлым обновлением: число рецептов в
+        # матрице совпадёт с базой после удаления другого.
+        vectors.remove([kept.pk])
+        Recipe.objects.filter(pk=deleted.pk).delete()
+        cache.clear()
+
+        vectors = similarity.get_recipe_vectors()
+
+        self.assertEqual(set(vectors.rows), {kept.pk})
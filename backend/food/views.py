@@ -1,6 +1,7 @@
 from rest_framework.decorators import action
 from rest_framework import viewsets, permissions, status
 from djoser.views import UserViewSet as DjoserUserViewSet
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from .serializers import (
     CustomUserSerializer,
@@ -10,20 +11,75 @@ from .serializers import (
     IngredientSerializer,
     RecipeListSerializer,
     RecipeCreateUpdateSerializer,
+    RecipeIdsSerializer,
+    RecipeImportSerializer,
     SubscribedUserSerializer,
+    get_recipes_limit,
+)
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Prefetch,
+    Value,
+    prefetch_related_objects,
 )
 from django.shortcuts import get_object_or_404
 from .models import Recipe, Ingredient, Favorite, ShoppingCart, User
 from users.models import Subscription
 from .filters import IngredientFilter, RecipeFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from .cache import (
+    INGREDIENTS_TAG,
+    RANKING_TAG,
+    RECIPES_LIST_TAG,
+    RECIPES_SEARCH_TAG,
+    RECIPES_TAG,
+    USERS_TAG,
+    AnonymousResponseCacheMixin,
+    ConditionalGetMixin,
+    recipe_tag,
+    user_tag,
+)
+from .autocomplete import DEFAULT_LIMIT, MAX_LIMIT, get_ingredient_index
+from .catalog import CATALOG_MAX_AGE, get_ingredient_catalog
+from .feed import FeedPagination
+from .ranking import RANKING_ORDERINGS
+from .similarity import (
+    DEFAULT_LIMIT as SIMILAR_DEFAULT_LIMIT,
+    MAX_LIMIT as SIMILAR_MAX_LIMIT,
+    get_recipe_vectors,
+)
+from .pagination import CachedCountPagination
 from .permissions import IsAuthorOrReadOnly
-from django.http import FileResponse
-from django.utils.timezone import now
+from .bulk import (
+    bulk_add_relations,
+    bulk_create_recipes,
+    bulk_remove_relations,
+)
+from .services import (
+    add_recipe_to_shopping_lists,
+    add_recipes_to_shopping_list,
+    remove_recipe_from_shopping_lists,
+    remove_recipes_from_shopping_list,
+)
+from .shopping_list import SHOPPING_LIST_RENDERERS, ShoppingList
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.urls import reverse
 
 
-class UserViewSet(DjoserUserViewSet):
+def get_limit(request, default, maximum):
+    limit = request.query_params.get("limit", "")
+    limit = int(limit) if limit.isdigit() else default
+    return min(max(limit, 1), maximum)
+
+
+class UserViewSet(ConditionalGetMixin, DjoserUserViewSet):
     serializer_class = CustomUserSerializer
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,)
@@ -40,6 +96,18 @@ class UserViewSet(DjoserUserViewSet):
         "subscribe": SubscribedUserSerializer,
     }
 
+    def get_keyset_ordering(self):
+        return ("username", "id")
+
+    def get_etag_tags(self):
+        if self.action == "retrieve":
+            return [user_tag(self.kwargs[self.lookup_field])]
+        if self.action == "me":
+            return [user_tag(self.request.user.pk)]
+        if self.action == "subscriptions":
+            return [USERS_TAG, RECIPES_TAG]
+        return [USERS_TAG]
+
     def get_serializer_class(self):
         return self.serializer_action_classes.get(
             self.action, super().get_serializer_class()
@@ -62,7 +130,6 @@ class UserViewSet(DjoserUserViewSet):
             return Response(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
 
-        user.avatar.delete()
         user.avatar = None
         user.save()
         return Response(
@@ -77,12 +144,33 @@ class UserViewSet(DjoserUserViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def subscriptions(self, request):
-        user = request.user
-        subscribed_authors = User.objects.filter(
-            subscribers__follower=user
-        ).prefetch_related("recipes")
+        return self.get_conditional_response(self._subscriptions, request)
+
+    def get_subscribed_authors(self):
+        return User.objects.annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        )
+
+    def prefetch_latest_recipes(self, authors):
+        prefetch_related_objects(
+            authors,
+            Prefetch(
+                "recipes",
+                queryset=Recipe.objects.latest_per_author(
+                    [author.pk for author in authors],
+                    get_recipes_limit(self.request),
+                ),
+                to_attr="latest_recipes",
+            ),
+        )
+
+    def _subscriptions(self, request):
+        subscribed_authors = self.get_subscribed_authors().filter(
+            subscribers__follower=request.user
+        )
 
         page = self.paginate_queryset(subscribed_authors)
+        self.prefetch_latest_recipes(page)
         serializer = SubscribedUserSerializer(
             page, many=True, context={"request": request}
         )
@@ -117,6 +205,8 @@ class UserViewSet(DjoserUserViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+            author = self.get_subscribed_authors().get(pk=author.pk)
+            self.prefetch_latest_recipes([author])
             serializer = self.get_serializer(author,
                                              context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -138,8 +228,10 @@ class UserViewSet(DjoserUserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousResponseCacheMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    pagination_class = CachedCountPagination
     permission_classes = [
         permissions.IsAuthenticatedOrReadOnly,
         IsAuthorOrReadOnly,
@@ -147,11 +239,117 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_response_cache_tags(self, data):
+        if self.action == "retrieve":
+            return [recipe_tag(data["id"]), user_tag(data["author"]["id"])]
+
+        tags = {RECIPES_LIST_TAG}
+        if self.request.query_params.get("search"):
+            tags.add(RECIPES_SEARCH_TAG)
+        if self.get_ranking_ordering():
+            tags.add(RANKING_TAG)
+        for recipe in data["results"]:
+            tags.add(recipe_tag(recipe["id"]))
+            tags.add(user_tag(recipe["author"]["id"]))
+        return tags
+
+    def get_etag_tags(self):
+        if self.action == "retrieve":
+            return [recipe_tag(self.kwargs["pk"]), USERS_TAG]
+        if self.get_ranking_ordering():
+            return [RECIPES_TAG, USERS_TAG, RANKING_TAG]
+        return [RECIPES_TAG, USERS_TAG]
+
+    def get_ranking_ordering(self):
+        return RANKING_ORDERINGS.get(
+            self.request.query_params.get("ordering")
+        )
+
+    def get_keyset_ordering(self):
+        ranking_ordering = self.get_ranking_ordering()
+        if ranking_ordering:
+            return ranking_ordering
+        if self.request.query_params.get("search"):
+            return ("-rank", "-id")
+        return ("-created_at", "-id")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "feed", "similar", "cookable"):
+            queryset = queryset.with_user_flags(self.request.user)
+        elif self.action == "retrieve":
+            queryset = queryset.for_user(self.request.user)
+        return queryset
+
     def get_serializer_class(self):
-        if self.action in ["list", "retrieve"]:
+        if self.action in ["list", "retrieve", "feed", "similar",
+                           "cookable"]:
             return RecipeListSerializer
         return RecipeCreateUpdateSerializer
 
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+        pagination_class=FeedPagination,
+        url_path="feed",
+    )
+    def feed(self, request):
+        return self.get_conditional_response(self._feed, request)
+
+    def _feed(self, request):
+        self.feed_author_ids = list(
+            Subscription.objects.filter(follower=request.user)
+            .values_list("author_id", flat=True)
+        )
+        page = self.paginate_queryset(
+            self.get_queryset().filter(author_id__in=self.feed_author_ids)
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=["get"], url_path="similar")
+    def similar(self, request, pk=None):
+        return self.get_conditional_response(self._similar, request)
+
+    def _similar(self, request):
+        recipe = get_object_or_404(Recipe, pk=self.kwargs["pk"])
+        matches = get_recipe_vectors().similar(
+            recipe.pk,
+            get_limit(request, SIMILAR_DEFAULT_LIMIT, SIMILAR_MAX_LIMIT),
+        )
+        return self.get_ranked_response(matches)
+
+    @action(detail=False, methods=["get"], url_path="cookable")
+    def cookable(self, request):
+        return self.get_conditional_response(self._cookable, request)
+
+    def _cookable(self, request):
+        have = request.query_params.get("have", "")
+        ingredient_ids = [
+            int(value) for value in have.split(",") if value.strip().isdigit()
+        ]
+        if not ingredient_ids:
+            raise ValidationError(
+                {"have": "Укажите id ингредиентов через запятую."}
+            )
+        matches = get_recipe_vectors().cookable(
+            ingredient_ids,
+            get_limit(request, SIMILAR_DEFAULT_LIMIT, SIMILAR_MAX_LIMIT),
+        )
+        return self.get_ranked_response(matches)
+
+    def get_ranked_response(self, matches):
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in matches]
+        )
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _ in matches
+             if recipe_id in recipes],
+            many=True,
+        )
+        return Response(serializer.data)
+
     @action(
         detail=True,
         methods=["post", "delete"],
@@ -168,14 +366,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path="shopping_cart",
     )
     def shopping_cart(self, request, pk=None):
-        return self._handle_toggle(request, ShoppingCart)
+        return self._handle_toggle(
+            request,
+            ShoppingCart,
+            on_add=add_recipe_to_shopping_lists,
+            on_remove=remove_recipe_from_shopping_lists,
+        )
 
-    def _handle_toggle(self, request, model):
+    @transaction.atomic
+    def _handle_toggle(self, request, model, on_add=None, on_remove=None):
         recipe = self.get_object()
         user = request.user
-        obj, created = model.objects.get_or_create(user=user, recipe=recipe)
 
         if request.method == "POST":
+            _, created = model.objects.get_or_create(user=user, recipe=recipe)
             if not created:
                 return Response(
                     {
@@ -186,11 +390,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     },
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            if on_add:
+                on_add(recipe, user)
             serializer = RecipeShortSerializer(recipe,
                                                context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if created:
+        obj = model.objects.filter(user=user, recipe=recipe).first()
+        if not obj:
             return Response(
                 {
                     "errors": (
@@ -200,9 +407,89 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if on_remove:
+            on_remove(recipe, user)
         obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path="favorite",
+    )
+    def favorite_bulk(self, request):
+        return self._handle_bulk_toggle(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path="shopping_cart",
+    )
+    def shopping_cart_bulk(self, request):
+        return self._handle_bulk_toggle(
+            request,
+            ShoppingCart,
+            on_add=add_recipes_to_shopping_list,
+            on_remove=remove_recipes_from_shopping_list,
+        )
+
+    @transaction.atomic
+    def _handle_bulk_toggle(self, request, model, on_add=None,
+                            on_remove=None):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data["recipes"]))
+
+        if request.method == "POST":
+            results = bulk_add_relations(model, request.user, recipe_ids,
+                                         on_add)
+        else:
+            results = bulk_remove_relations(model, request.user, recipe_ids,
+                                            on_remove)
+        return Response([
+            {"id": recipe_id, "status": result}
+            for recipe_id, result in results.items()
+        ])
+
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path="import",
+    )
+    def import_recipes(self, request):
+        serializer = RecipeImportSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+
+        results = []
+        valid = []
+        for index, item_serializer in enumerate(
+            serializer.get_item_serializers()
+        ):
+            if item_serializer.is_valid():
+                valid.append((index, item_serializer.validated_data))
+            else:
+                results.append({
+                    "index": index,
+                    "status": "invalid",
+                    "errors": item_serializer.errors,
+                })
+
+        with transaction.atomic():
+            recipes = bulk_create_recipes(
+                request.user, [data for _, data in valid]
+            )
+        results.extend(
+            {"index": index, "status": "created", "id": recipe.pk}
+            for (index, _), recipe in zip(valid, recipes)
+        )
+        results.sort(key=lambda result: result["index"])
+        return Response(results)
+
     @action(
         detail=True,
         methods=["get"],
@@ -219,45 +506,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=["get"],
         permission_classes=[permissions.IsAuthenticated],
         url_path="download_shopping_cart",
+        renderer_classes=SHOPPING_LIST_RENDERERS,
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        recipes = {item.recipe for item in user.shoppingcart_relations.all()}
-        ingredients = {}
-        recipe_list = []
-
-        for recipe in recipes:
-            author_name = recipe.author.get_full_name()
-            recipe_list.append(f"{recipe.name} — {author_name}")
-            for item in recipe.recipe_ingredients.all():
-                name = item.ingredient.name.capitalize()
-                unit = item.ingredient.measurement_unit
-                key = f"{name} ({unit})"
-                ingredients[key] = ingredients.get(key, 0) + item.amount
-
-        sorted_ingredients = dict(sorted(ingredients.items()))
-        date = now().strftime("%d.%m.%Y")
-        content = f"Список покупок (сформирован {date}):\n\n"
-
-        for idx, (name, amount) in enumerate(sorted_ingredients.items(), 1):
-            content += f"{idx}. {name}: {amount}\n"
-
-        content += "\nРецепты:\n"
-        for recipe in recipe_list:
-            content += f"- {recipe}\n"
-
-        from io import BytesIO
-        file_like = BytesIO(content.encode("utf-8"))
-
-        return FileResponse(
-            file_like,
-            as_attachment=True,
-            filename="shopping_list.txt",
-            content_type="text/plain; charset=utf-8",
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+
+        response = StreamingHttpResponse(
+            renderer.iter_render(ShoppingList(request.user)),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
+        return response
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
@@ -265,3 +532,47 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ("^name",)
     pagination_class = None
+
+    def get_etag_tags(self):
+        return [INGREDIENTS_TAG]
+
+    @action(detail=False, methods=["get"], url_path="autocomplete")
+    def autocomplete(self, request):
+        return self.get_conditional_response(self._autocomplete, request)
+
+    def _autocomplete(self, request):
+        query = request.query_params.get("name", "")
+        limit = get_limit(request, DEFAULT_LIMIT, MAX_LIMIT)
+
+        ingredients = get_ingredient_index().search(query, limit)
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["get"], url_path="catalog")
+    def catalog(self, request):
+        catalog = get_ingredient_catalog()
+        response = HttpResponseRedirect(f"{request.path}{catalog.digest}/")
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"catalog/(?P<digest>[0-9a-f]+)",
+    )
+    def catalog_snapshot(self, request, digest):
+        catalog = get_ingredient_catalog()
+        if digest != catalog.digest:
+            raise Http404
+
+        encoding, body = catalog.get_body(
+            request.META.get("HTTP_ACCEPT_ENCODING", "")
+        )
+        response = HttpResponse(body, content_type="application/json")
+        if encoding:
+            response["Content-Encoding"] = encoding
+        response["ETag"] = f'"{catalog.digest}"'
+        patch_vary_headers(response, ("Accept-Encoding",))
+        patch_cache_control(response, public=True, immutable=True,
+                            max_age=CATALOG_MAX_AGE)
+        return response
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:13
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('users', '0007_alter_user_managers'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(fields=['author', 'follower'], name='subscription_author_idx'),
+        ),
+    ]
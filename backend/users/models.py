@@ -1,9 +1,47 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import RegexValidator
+from django.db.models import BooleanField, Exists, OuterRef, Value
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+    def with_is_subscribed(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(follower=user,
+                                            author=OuterRef("pk"))
+            )
+        )
+
+
+class CounterFieldsMixin:
+    """
+    Счётчики и рейтинги меняются только отдельными UPDATE, поэтому при
+    сохранении уже существующего объекта они исключаются из запроса, чтобы
+    устаревшее значение в памяти не затёрло значение в базе.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+class User(CounterFieldsMixin, AbstractUser):
     avatar = models.ImageField(
         upload_to="users/",
         blank=True,
@@ -11,6 +49,12 @@ class User(AbstractUser):
         default=None,
         verbose_name="Аватар пользователя",
     )
+    avatar_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Варианты аватара",
+    )
 
     email = models.EmailField("Адрес электронной почты", max_length=254,
                               unique=True)
@@ -29,9 +73,24 @@ class User(AbstractUser):
     first_name = models.CharField("Имя", max_length=150)
     last_name = models.CharField("Фамилия", max_length=150)
 
+    recipes_count = models.PositiveIntegerField(
+        "Рецепты", default=0, editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        "Подписчики", default=0, editable=False
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        "Подписки", default=0, editable=False
+    )
+
+    counter_fields = ("recipes_count", "subscribers_count",
+                      "subscriptions_count")
+
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
 
+    objects = CustomUserManager()
+
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
@@ -63,6 +122,10 @@ class Subscription(models.Model):
                 fields=["follower", "author"], name="unique_subscription"
             )
         ]
+        indexes = [
+            models.Index(fields=["author", "follower"],
+                         name="subscription_author_idx"),
+        ]
 
     def __str__(self):
         return f"{self.follower} подписан на {self.author}"